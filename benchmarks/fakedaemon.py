@@ -0,0 +1,190 @@
+"""
+A simulated Docker daemon for benchmarking docker-rotate without a real engine.
+
+FakeClient implements the parts of docker-py's Client that docker-rotate uses, backed by an
+in-memory population of synthetic images and containers. Every call sleeps for a configurable
+latency (to stand in for the round trip to the daemon) and is counted by endpoint.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+import random
+import threading
+import time
+
+from docker.errors import NotFound
+
+
+API_VERSION = "1.24"
+
+STATUSES = ("running", "exited", "created", "dead")
+
+
+class FakeResponse(object):
+    """
+    Just enough of a requests response for docker-py's APIError.
+    """
+    status_code = 404
+    reason = "Not Found"
+
+    def __init__(self, content):
+        self.content = content
+
+
+def _not_found(kind, object_id):
+    message = "No such {}: {}".format(kind, object_id)
+    return NotFound(message, FakeResponse(message))
+
+
+def _timestamp(dt):
+    # docker reports nanosecond precision
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"
+
+
+class FakeClient(object):
+
+    def __init__(self, latency=0.0, api_version=API_VERSION):
+        self.latency = latency
+        self.api_version = api_version
+        self.images_by_id = {}
+        self.containers_by_id = {}
+        self.image_ids_by_tag = {}
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _call(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def populate(self, images, containers, names=None, seed=0):
+        """
+        Create a synthetic population of tagged/untagged images and containers.
+
+        Images are spread over `names` repositories (default: one per 20 images); one in ten is
+        untagged. Containers use random images and are spread over all states, with most running.
+        """
+        rng = random.Random(seed)
+        names = names or max(1, images // 20)
+        now = datetime.utcnow()
+        epoch = int(time.time())
+
+        image_ids = []
+        for index in range(images):
+            image_id = "sha256:{:064x}".format(index)
+            if index % 10 == 9:
+                repo_tags = ["<none>:<none>"]
+            else:
+                name = "registry.example.com/org/app{}".format(rng.randrange(names))
+                repo_tags = ["{}:build-{}".format(name, index)]
+                if rng.random() < 0.1:
+                    repo_tags.append("{}:latest-{}".format(name, index))
+            for repo_tag in repo_tags:
+                if repo_tag != "<none>:<none>":
+                    self.image_ids_by_tag[repo_tag] = image_id
+            size = rng.randint(10, 500) * 1024 ** 2
+            self.images_by_id[image_id] = dict(
+                Id=image_id,
+                ParentId="",
+                RepoTags=repo_tags,
+                RepoDigests=[],
+                Created=epoch - rng.randint(0, 90 * 24 * 3600),
+                Size=size,
+                VirtualSize=size,
+                Labels={},
+            )
+            image_ids.append(image_id)
+
+        for index in range(containers):
+            container_id = "{:064x}".format(index)
+            image_id = rng.choice(image_ids) if image_ids else "sha256:" + "0" * 64
+            status = rng.choice(STATUSES * 2 + ("running",) * 4)
+            created = now - timedelta(seconds=rng.randint(3600, 60 * 24 * 3600))
+            finished = created + timedelta(seconds=rng.randint(0, 1800))
+            self.containers_by_id[container_id] = dict(
+                Id=container_id,
+                Image=image_id,
+                Name="/container{}".format(index),
+                Created=_timestamp(created),
+                State=dict(
+                    Status=status,
+                    Running=status == "running",
+                    Paused=False,
+                    Restarting=False,
+                    Dead=status == "dead",
+                    OOMKilled=False,
+                    Pid=1234 if status == "running" else 0,
+                    ExitCode=0,
+                    StartedAt=_timestamp(created) if status != "created" else
+                    "0001-01-01T00:00:00Z",
+                    FinishedAt=_timestamp(finished) if status in ("exited", "dead") else
+                    "0001-01-01T00:00:00Z",
+                ),
+            )
+        return self
+
+    # docker-py Client API
+
+    def version(self, api_version=True):
+        self._call("version")
+        return dict(ApiVersion=self.api_version, Version="1.12.0")
+
+    def images(self, name=None, quiet=False, all=False, viz=False, filters=None):
+        self._call("images")
+        dangling = (filters or {}).get("dangling")
+        with self._lock:
+            images = list(self.images_by_id.values())
+        if dangling:
+            images = [image for image in images if image["RepoTags"] == ["<none>:<none>"]]
+        return [dict(image, RepoTags=list(image["RepoTags"])) for image in images]
+
+    def containers(self, quiet=False, all=False, trunc=False, latest=False, since=None,
+                   before=None, limit=-1, size=False, filters=None):
+        self._call("containers")
+        statuses = (filters or {}).get("status")
+        if isinstance(statuses, basestring):
+            statuses = [statuses]
+        with self._lock:
+            containers = list(self.containers_by_id.values())
+        return [
+            dict(
+                Id=container["Id"],
+                Image=container["Image"],
+                ImageID=container["Image"],
+                Names=[container["Name"]],
+                Created=0,
+                State=container["State"]["Status"],
+                Status="",
+            )
+            for container in containers
+            if (all or container["State"]["Status"] == "running") and
+            (statuses is None or container["State"]["Status"] in statuses)
+        ]
+
+    def inspect_container(self, container):
+        self._call("inspect_container")
+        try:
+            inspect_data = self.containers_by_id[container]
+        except KeyError:
+            raise _not_found("container", container)
+        return dict(inspect_data, State=dict(inspect_data["State"]))
+
+    def remove_container(self, container, v=False, link=False, force=False):
+        self._call("remove_container")
+        with self._lock:
+            if self.containers_by_id.pop(container, None) is None:
+                raise _not_found("container", container)
+
+    def remove_image(self, image, force=False, noprune=False):
+        self._call("remove_image")
+        with self._lock:
+            if image in self.image_ids_by_tag:
+                image_data = self.images_by_id[self.image_ids_by_tag.pop(image)]
+                image_data["RepoTags"].remove(image)
+                if not image_data["RepoTags"]:
+                    del self.images_by_id[image_data["Id"]]
+            elif image in self.images_by_id:
+                for repo_tag in self.images_by_id.pop(image)["RepoTags"]:
+                    self.image_ids_by_tag.pop(repo_tag, None)
+            else:
+                raise _not_found("image", image)
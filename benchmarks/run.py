@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmark docker-rotate subcommands against a simulated Docker daemon.
+
+Each subcommand runs in its own process against a freshly populated FakeClient, and the wall
+time, number of daemon calls by endpoint, and peak memory (max RSS) of that process are
+reported. For example:
+
+    python benchmarks/run.py --images 100000 --containers 20000 --latency 0.001
+"""
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from multiprocessing import Process, Queue
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dockerrotate.main import parse_arguments  # noqa
+from fakedaemon import FakeClient  # noqa
+
+
+SCENARIOS = {
+    "images": ["images", "--keep", "3"],
+    "untagged-images": ["untagged-images"],
+    "containers": ["containers", "--exited", "1d", "--created", "1d", "--dead", "1h"],
+    "all": ["all", "--exited", "1d", "--created", "1d", "--dead", "1h", "--keep", "3"],
+}
+
+
+def _run(scenario, options, results):
+    client = FakeClient(latency=options.latency).populate(
+        options.images, options.containers, names=options.names)
+
+    args = parse_arguments(options.global_args + SCENARIOS[scenario])
+    args.client = client
+    args.api_version = client.api_version
+    with open(os.devnull, "w") as devnull:
+        args.reporter.stream = devnull
+
+        started = time.time()
+        args.func(args)
+        args.reporter.close()
+        wall_time = time.time() - started
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((scenario, wall_time, dict(client.calls), peak_memory))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0],
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--images", type=int, default=10000,
+                        help="Number of images in the simulated daemon")
+    parser.add_argument("--containers", type=int, default=10000,
+                        help="Number of containers in the simulated daemon")
+    parser.add_argument("--names", type=int,
+                        help="Number of distinct image names (default: one per 20 images)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Simulated round trip time of each daemon call, in seconds")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Subcommand(s) to benchmark (default: all of them)")
+    parser.add_argument("global_args", nargs="*",
+                        help="Global docker-rotate arguments, after '--' "
+                             "(e.g. -- --concurrency 8)")
+    options = parser.parse_args()
+
+    print "{:<16} {:>10} {:>12}  {}".format("scenario", "wall (s)", "peak (MB)", "daemon calls")
+    for scenario in options.scenario or sorted(SCENARIOS):
+        results = Queue()
+        process = Process(target=_run, args=(scenario, options, results))
+        process.start()
+        scenario, wall_time, calls, peak_memory = results.get()
+        process.join()
+
+        print "{:<16} {:>10.2f} {:>12.1f}  {}".format(
+            scenario,
+            wall_time,
+            peak_memory / 1024.0,
+            ", ".join("{}={}".format(endpoint, count)
+                      for endpoint, count in sorted(calls.items())),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Benchmark the startup time of docker-rotate, as felt by frequent (e.g. cron) invocations.
+
+Each measurement runs a fresh Python process, and reports the best and median wall time over
+several runs, along with the heavyweight modules that process imported:
+
+ - "help": "docker-rotate --help"
+ - "parse <subcommand>": importing docker-rotate and parsing a subcommand's arguments
+ - "run containers": a complete "containers" run against an empty simulated daemon (see
+   "fakedaemon.py"), whose calls each take "--latency" seconds, without and with
+   "--version-cache"
+
+    python benchmarks/startup.py --repeat 20 --latency 0.05
+"""
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("docker", "requests", "dateutil.parser", "sqlite3")
+
+PARSE_SCENARIOS = {
+    "images": ["images", "--keep", "3"],
+    "untagged-images": ["untagged-images"],
+    "containers": ["containers", "--exited", "1h"],
+    "all": ["all", "--exited", "1h", "--keep", "3"],
+    "watch": ["watch", "--exited", "1h"],
+}
+
+PREAMBLE = """
+import sys
+sys.path[:0] = {paths!r}
+"""
+
+REPORT_MODULES = """
+sys.stderr.write(" ".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+PARSE = PREAMBLE + """
+from dockerrotate.main import parse_arguments
+parse_arguments({arg_values!r})
+""" + REPORT_MODULES
+
+HELP = PREAMBLE + """
+from dockerrotate.main import main
+try:
+    main(["--help"])
+except SystemExit:
+    pass
+""" + REPORT_MODULES
+
+RUN = PREAMBLE + """
+import docker
+from fakedaemon import FakeClient
+docker.Client = lambda **kwargs: FakeClient(latency={latency!r})
+from dockerrotate.main import main
+main({arg_values!r})
+""" + REPORT_MODULES
+
+
+def _measure(code, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.time()
+        process = subprocess.Popen([sys.executable, "-c", code],
+                                   stdout=open(os.devnull, "w"), stderr=subprocess.PIPE)
+        _, modules = process.communicate()
+        times.append(time.time() - started)
+        if process.returncode:
+            raise SystemExit("Benchmark process failed:\n{}".format(modules))
+    times.sort()
+    return times[0], times[len(times) // 2], modules.strip()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0],
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Number of processes to run per measurement")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Simulated round trip time of each daemon call, in seconds")
+    options = parser.parse_args()
+
+    paths = [ROOT, os.path.join(ROOT, "benchmarks")]
+    measurements = [("help", HELP.format(paths=paths, modules=HEAVY_MODULES))]
+    for scenario, arg_values in sorted(PARSE_SCENARIOS.items()):
+        measurements.append(("parse " + scenario, PARSE.format(
+            paths=paths, modules=HEAVY_MODULES, arg_values=arg_values)))
+
+    temporary_dir = tempfile.mkdtemp()
+    version_cache = os.path.join(temporary_dir, "versions.json")
+    for name, global_args in [("run containers", []),
+                              ("run containers (cached version)",
+                               ["--version-cache", version_cache])]:
+        measurements.append((name, RUN.format(
+            paths=paths, modules=HEAVY_MODULES, latency=options.latency,
+            arg_values=global_args + PARSE_SCENARIOS["containers"])))
+
+    try:
+        print "{:<32} {:>10} {:>12}  {}".format("measurement", "best (ms)", "median (ms)",
+                                                "heavy imports")
+        for name, code in measurements:
+            best, median, modules = _measure(code, options.repeat)
+            print "{:<32} {:>10.1f} {:>12.1f}  {}".format(
+                name, best * 1000, median * 1000, modules or "-")
+    finally:
+        shutil.rmtree(temporary_dir)
+
+
+if __name__ == "__main__":
+    main()
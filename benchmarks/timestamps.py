@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark the parsing of Docker timestamps: dateutil's parser against parse_timestamp.
+
+    python benchmarks/timestamps.py --number 100000
+"""
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import parser as dateutil_parser  # noqa
+from dockerrotate.timestamps import parse_timestamp  # noqa
+
+
+SAMPLES = {
+    "nanoseconds": "2016-08-03T17:29:53.474346591Z",
+    "whole seconds": "2016-08-03T17:29:53Z",
+    "zero value": "0001-01-01T00:00:00Z",
+}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0],
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000,
+                        help="Number of timestamps to parse per measurement")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of measurements; the best is reported")
+    options = parser.parse_args()
+
+    print "{:<16} {:>16} {:>16} {:>10}".format(
+        "timestamp", "dateutil (us)", "fast path (us)", "speedup")
+    for name, value in sorted(SAMPLES.items()):
+        assert parse_timestamp(value) == dateutil_parser.parse(value)
+        costs = [min(timeit.repeat(lambda: parse(value), number=options.number,
+                                   repeat=options.repeat)) / options.number * 1e6
+                 for parse in (dateutil_parser.parse, parse_timestamp)]
+        print "{:<16} {:>16.2f} {:>16.2f} {:>9.1f}x".format(
+            name, costs[0], costs[1], costs[0] / costs[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+An optional on-disk cache of container inspection facts, kept between runs.
+
+Once a container has stopped, the only facts the container policies need (its status, when it
+was created and when it finished) don't change until it is removed. With "--inspect-cache PATH",
+those facts are kept in a small SQLite database, so repeated runs only inspect containers that
+are new since the last run.
+
+A cached entry is only used while the container list still agrees with it: the list must show
+the cached status and, for an exited container, a time since it exited ("Exited (0) 3 days ago")
+consistent with the cached finish time. So a container that has been restarted is inspected
+again, even if it has exited again since. Entries for containers that are no longer listed are
+dropped when the cache is saved. Entries are kept per daemon, so one file can be shared by runs
+against several hosts.
+"""
+from datetime import datetime, timedelta
+import re
+import sqlite3
+import threading
+
+from dateutil.tz import tzutc
+
+from dockerrotate.timestamps import parse_timestamp
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=tzutc())
+
+# statuses that don't change without the container being started or removed
+CACHEABLE_STATUSES = ("exited", "dead", "created")
+
+# how each cacheable status starts in the human readable "Status" of the container list
+LIST_STATUS_PREFIXES = {"exited": "Exited", "dead": "Dead", "created": "Created"}
+
+# the time since an exited container finished, as the daemon reports it in the list's "Status"
+EXITED_STATUS_REGEX = re.compile(
+    r'Exited \(-?\d+\) '
+    r'(?:(\d+) (second|minute|hour|day|week|month|year)s?|'
+    r'(Less than a second|About a minute|About an hour)) ago\Z')
+
+UNIT_SECONDS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+    "week": 7 * 24 * 60 * 60,
+    "month": 30 * 24 * 60 * 60,
+    "year": 365 * 24 * 60 * 60,
+}
+
+APPROXIMATE_SECONDS = {"Less than a second": 1, "About a minute": 60, "About an hour": 60 * 60}
+
+# allowance for the time between listing containers and checking the cache, and clock skew
+CLOCK_SLACK_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    daemon TEXT NOT NULL,
+    id TEXT NOT NULL,
+    image TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (daemon, id)
+)
+"""
+
+
+def _to_epoch(value):
+    return _to_seconds(parse_timestamp(value))
+
+
+def _to_seconds(value):
+    return (value - EPOCH).total_seconds()
+
+
+def _from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def _max_exited_seconds_ago(status_text):
+    """
+    Return an upper bound on how long ago a container exited, from its "Status" in the list, or
+    None if it can't be read.
+
+    The daemon rounds the time down to a whole number of units (hours to the nearest one), so
+    one more unit is an upper bound.
+    """
+    match = EXITED_STATUS_REGEX.match(status_text)
+    if match is None:
+        return None
+    count, unit, approximate = match.groups()
+    if approximate:
+        return 2 * APPROXIMATE_SECONDS[approximate]
+    return (int(count) + 1) * UNIT_SECONDS[unit]
+
+
+def _agrees(container, status, finished_at, now):
+    """
+    Return True if the container's list data confirms the cached entry is still current.
+    """
+    if container.get("State", status) != status:
+        return False
+    status_text = container.get("Status", "")
+    if not status_text.startswith(LIST_STATUS_PREFIXES[status]):
+        return False
+    if status != "exited":
+        # created and dead containers can't return to the same status
+        return True
+
+    # a container that was restarted and has exited again exited more recently than we know of
+    max_seconds_ago = _max_exited_seconds_ago(status_text)
+    return max_seconds_ago is not None and \
+        _to_seconds(now) - finished_at <= max_seconds_ago + CLOCK_SLACK_SECONDS
+
+
+class InspectionCache(object):
+    """
+    Cached inspection facts for the containers of one daemon.
+
+    Entries are loaded into memory when the cache is opened and written back by save(), so
+    lookups are safe from worker threads and never touch the database.
+    """
+
+    def __init__(self, path, daemon):
+        self.path = path
+        self.daemon = daemon
+        self._entries = {}
+        self._added = {}
+        self._removed = set()
+        self._lock = threading.Lock()
+
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute(SCHEMA)
+            for row in connection.execute(
+                    "SELECT id, image, status, created, finished_at FROM containers "
+                    "WHERE daemon = ?", (daemon,)):
+                self._entries[row[0]] = row[1:]
+        finally:
+            connection.close()
+
+    def get(self, container, now):
+        """
+        Return inspection data for the container (an entry in the container list), in the shape
+        of the daemon's, or None. `now` is the time the list was made.
+
+        Timestamps are returned as datetimes rather than strings.
+        """
+        with self._lock:
+            entry = self._entries.get(container["Id"])
+        if entry is None:
+            return None
+
+        image, status, created, finished_at = entry
+        if not _agrees(container, status, finished_at, now):
+            self.discard(container["Id"])
+            return None
+
+        return dict(
+            Id=container["Id"],
+            Image=image,
+            Created=_from_epoch(created),
+            State=dict(Status=status, FinishedAt=_from_epoch(finished_at)),
+        )
+
+    def put(self, inspect_data):
+        """
+        Remember the facts from a container's inspection data, if they can't change.
+        """
+        status = inspect_data["State"]["Status"]
+        if status not in CACHEABLE_STATUSES:
+            return
+
+        entry = (
+            inspect_data["Image"],
+            status,
+            _to_epoch(inspect_data["Created"]),
+            _to_epoch(inspect_data["State"]["FinishedAt"]),
+        )
+        with self._lock:
+            self._entries[inspect_data["Id"]] = entry
+            self._added[inspect_data["Id"]] = entry
+
+    def discard(self, container_id):
+        """
+        Forget a container, e.g. because its state has changed.
+        """
+        with self._lock:
+            self._entries.pop(container_id, None)
+            self._added.pop(container_id, None)
+            self._removed.add(container_id)
+
+    def retain(self, container_ids):
+        """
+        Forget all containers except those given, i.e. those the daemon still lists.
+        """
+        container_ids = set(container_ids)
+        with self._lock:
+            gone = [container_id for container_id in self._entries
+                    if container_id not in container_ids]
+        for container_id in gone:
+            self.discard(container_id)
+
+    def save(self):
+        """
+        Write new entries to the database, and delete forgotten ones.
+        """
+        with self._lock:
+            added = [(self.daemon, container_id) + entry
+                     for container_id, entry in self._added.items()]
+            removed = [(self.daemon, container_id) for container_id in self._removed]
+            self._added = {}
+            self._removed = set()
+
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                connection.executemany(
+                    "DELETE FROM containers WHERE daemon = ? AND id = ?", removed)
+                connection.executemany(
+                    "INSERT OR REPLACE INTO containers "
+                    "(daemon, id, image, status, created, finished_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", added)
+        finally:
+            connection.close()
+
+
+def open_inspection_cache(args):
+    """
+    Open the cache selected by "--inspect-cache" for the daemon args.client talks to, if any.
+    """
+    if not args.inspect_cache_path:
+        return None
+    return InspectionCache(args.inspect_cache_path, args.daemon)
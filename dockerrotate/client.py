@@ -0,0 +1,120 @@
+"""
+Creation of the Docker client.
+
+docker-py takes a large share of docker-rotate's startup time to import, so it's only imported
+once a client is actually made.
+"""
+import json
+import os
+import threading
+import time
+
+from dockerrotate.compat import negotiated_api_version
+from dockerrotate.stats import InstrumentedClient
+
+
+DEFAULT_BASE_URL = "unix:///var/run/docker.sock"
+
+# serializes updates to the version cache file by concurrent runs against several hosts
+_version_cache_lock = threading.Lock()
+
+
+def _read_version_cache(path):
+    try:
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (IOError, ValueError):
+        # missing or corrupt; start afresh
+        return {}
+
+
+def cached_server_version(args, daemon):
+    """
+    Return the API version the daemon reported within the last "--version-cache-ttl", if known.
+    """
+    if not args.version_cache_path:
+        return None
+    with _version_cache_lock:
+        entry = _read_version_cache(args.version_cache_path).get(daemon)
+    if entry is None or time.time() - entry["checked"] > args.version_cache_ttl.total_seconds():
+        return None
+    return entry["ApiVersion"]
+
+
+def save_server_version(args, daemon, api_version):
+    if not args.version_cache_path:
+        return
+    with _version_cache_lock:
+        versions = _read_version_cache(args.version_cache_path)
+        versions[daemon] = dict(ApiVersion=api_version, checked=time.time())
+
+        temporary_path = "{}.{}.tmp".format(args.version_cache_path, os.getpid())
+        with open(temporary_path, "w") as cache_file:
+            json.dump(versions, cache_file, indent=1, sort_keys=True)
+        os.rename(temporary_path, args.version_cache_path)
+
+
+def make_client(args, environment=None):
+    """
+    Create a Docker client.
+
+    Either use the local socket (default) or use the standard environment
+    variables (e.g. DOCKER_HOST). This is much simpler than trying to pass
+    all the possible certificate options through argparse.
+
+    An alternative set of DOCKER_* variables can be supplied as `environment`.
+
+    With "--backend native", the client is our own SocketClient rather than docker-py's.
+
+    args.daemon is set to the daemon's URL, for keying anything kept per daemon.
+
+    With "--version-cache", the daemon's API version is remembered between runs, and the
+    version request (which also verifies we can talk to the daemon) is only made once the
+    cached version has expired.
+    """
+    from docker.errors import NotFound
+    from docker.utils import kwargs_from_env
+
+    if environment is None:
+        kwargs = kwargs_from_env(assert_hostname=False)
+    else:
+        kwargs = kwargs_from_env(assert_hostname=False, environment=environment)
+
+    if args.client_version:
+        kwargs["version"] = args.client_version
+    if args.timeout is not None:
+        kwargs["timeout"] = args.timeout
+
+    if args.backend == "native":
+        from dockerrotate.socketclient import SocketClient
+
+        if kwargs.get("tls"):
+            raise SystemExit("The native backend doesn't support TLS; use \"--backend docker-py\"")
+        docker_client = SocketClient(kwargs.get("base_url", DEFAULT_BASE_URL),
+                                     version=kwargs.get("version"),
+                                     timeout=kwargs.get("timeout"))
+    else:
+        from docker import Client
+
+        docker_client = Client(**kwargs)
+    client = InstrumentedClient(docker_client, args.stats)
+
+    # docker-py's base_url is the same for every unix socket, so caches are keyed on the setting
+    args.daemon = daemon = kwargs.get("base_url", DEFAULT_BASE_URL)
+    server_api_version = cached_server_version(args, daemon)
+    if server_api_version is not None:
+        args.stats.count("version_cache_hits")
+    else:
+        # Verify client can talk to server.
+        try:
+            server_api_version = client.version()["ApiVersion"]
+        except NotFound as error:
+            raise SystemExit(error)
+        save_server_version(args, daemon, server_api_version)
+
+    if docker_client.api_version is None:
+        # the native client speaks the daemon's API version unless told otherwise
+        docker_client.api_version = server_api_version
+    args.api_version = negotiated_api_version(client.api_version, server_api_version)
+
+    return client
@@ -0,0 +1,38 @@
+"""
+Code to run container, untagged image and tagged image cleanup in a single pass.
+
+Running the three subcommands one after another lists containers and images three times. Here we
+take one snapshot of containers and images, remove containers first, drop the removed containers
+from the snapshot (so the images they used are no longer considered in use), and then rotate
+untagged and tagged images against that same snapshot. Untagged images removed along the way are
+dropped from the image graph, so their tagged parents can be deleted rather than just untagged.
+"""
+from dockerrotate.containers import all_containers, determine_containers_to_remove, \
+    remove_containers
+from dockerrotate.graph import ImageGraph
+from dockerrotate.images import determine_images_to_remove, plan_image_removal, remove_images
+from dockerrotate.untagged import determine_untagged_images_to_remove, is_dangling, \
+    remove_untagged_images
+
+
+def clean_all(args):
+    containers = all_containers(args)
+    with args.stats.phase("list_images"):
+        graph = ImageGraph(args.client.images(all=True))
+    images = graph.top_level_images()
+
+    removed_containers = remove_containers(determine_containers_to_remove(args, containers), args)
+    removed_container_ids = set(container["Id"] for container in removed_containers)
+    containers = [container for container in containers
+                  if container["Id"] not in removed_container_ids]
+
+    untagged_images = [image for image in images if is_dangling(image)]
+    untagged_images_to_remove = determine_untagged_images_to_remove(untagged_images, containers,
+                                                                    args)
+    removed_images = remove_untagged_images(untagged_images_to_remove, args)
+    graph.remove(image["Id"] for image in removed_images)
+
+    tagged_images = [image for image in graph.top_level_images()
+                     if image.get("RepoTags") and not is_dangling(image)]
+    images_to_remove = determine_images_to_remove(tagged_images, containers, args)
+    remove_images(plan_image_removal(images_to_remove, graph, containers, args), args)
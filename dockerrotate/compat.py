@@ -0,0 +1,24 @@
+"""
+Helpers for deciding which Docker Engine API features can be relied upon.
+"""
+
+
+def _version_tuple(version):
+    return tuple(int(part) for part in version.split("."))
+
+
+def negotiated_api_version(client_version, server_version):
+    """
+    Return the API version requests will effectively be served at: the lower of the two.
+    """
+    return min(client_version, server_version, key=_version_tuple)
+
+
+def api_version_at_least(args, minimum):
+    """
+    Return True if the API version in use is known to be at least `minimum`.
+
+    When the version is unknown (args.api_version is None), assume an old engine.
+    """
+    return args.api_version is not None and \
+        _version_tuple(args.api_version) >= _version_tuple(minimum)
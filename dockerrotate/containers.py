@@ -1,6 +1,11 @@
-from dateutil import parser
+from datetime import datetime
 
-from docker.errors import APIError
+from docker.errors import NotFound
+
+from dockerrotate.compat import api_version_at_least
+from dockerrotate.removal import remove_all
+from dockerrotate.timestamps import parse_timestamp
+from dockerrotate.workers import imap_ordered
 
 
 def all_containers(args):
@@ -9,22 +14,67 @@ def all_containers(args):
 
     Includes backward-compatibility for the ImageID field.
     """
-    containers = args.client.containers(all=True)
+    with args.stats.phase("all_containers"):
+        containers = args.client.containers(all=True)
+
+        if containers and "ImageID" not in containers[0]:
+            # pre-1.21 API: retrieve image IDs. Inspection results are cached, so containers
+            # inspected here won't be inspected again when evaluating container policies.
+            inspected = list(inspect_containers(containers, args))
+            for container, inspect_data in inspected:
+                container["ImageID"] = inspect_data["Image"]
+            containers = [container for container, _ in inspected]
+
+        return containers
 
-    if containers and "ImageID" not in containers[0]:
-        # pre-1.21 API: retrieve image IDs
-        for container in containers:
-            container["ImageID"] = args.client.inspect_container(container["Id"])["Image"]
 
-    return containers
+def candidate_containers(args, containers=None):
+    """
+    Return list data for the containers that an enabled removal policy could apply to.
+
+    On API 1.23+ the daemon filters by status and reports each container's state in the list
+    itself, so running containers (usually the majority) never need to be inspected. Older
+    engines get the full list; their containers are judged after inspection.
+
+    If a container list is supplied, it is filtered instead of querying the daemon.
+    """
+    policies = (("exited", args.exited), ("created", args.created), ("dead", args.dead))
+    statuses = [status for status, threshold in policies if threshold is not None]
+    if not statuses:
+        return []
+
+    if containers is None:
+        if api_version_at_least(args, "1.23"):
+            containers = args.client.containers(all=True, filters=dict(status=statuses))
+        else:
+            containers = args.client.containers(all=True)
+
+    if args.inspect_cache is not None:
+        args.inspect_cache.retain(container["Id"] for container in containers)
+
+    return [container for container in containers
+            if "State" not in container or container["State"] in statuses]
 
 
 def inspect_container(container, args):
     """
     Return inspection data for the given container.
 
-    Includes backward-compatibility for the State.Status field.
+    Includes backward-compatibility for the State.Status field. Each container is inspected at
+    most once per run; results are cached in args.inspections by container Id, and in the
+    on-disk cache (if any) for stopped containers.
     """
+    try:
+        return args.inspections[container["Id"]]
+    except KeyError:
+        pass
+
+    if args.inspect_cache is not None:
+        inspect_data = args.inspect_cache.get(container, args.now)
+        args.stats.count("inspect_cache_hits" if inspect_data else "inspect_cache_misses")
+        if inspect_data is not None:
+            args.inspections[container["Id"]] = inspect_data
+            return inspect_data
 
     inspect_data = args.client.inspect_container(container["Id"])
     if "Status" not in inspect_data["State"]:
@@ -38,41 +88,105 @@ def inspect_container(container, args):
                          and inspect_data["State"]["StartedAt"] >= inspect_data["Created"]) else
             "created"
         )
+
+    args.inspections[container["Id"]] = inspect_data
+    if args.inspect_cache is not None:
+        args.inspect_cache.put(inspect_data)
     return inspect_data
 
 
-def include_container(container, args):
+def forget_inspection(container_id, args):
     """
-    Return truthy if container should be removed.
+    Drop cached inspection data for a container whose state has changed.
+    """
+    args.inspections.pop(container_id, None)
+    if args.inspect_cache is not None:
+        args.inspect_cache.discard(container_id)
+
+
+def inspect_containers(containers, args):
+    """
+    Inspect the given containers concurrently, yielding (container, inspect data) pairs in order.
+
+    Containers that are removed by someone else before we get to inspect them are skipped.
+    """
+    def _inspect(container):
+        try:
+            return container, inspect_container(container, args)
+        except NotFound:
+            return container, None
+
+    for container, inspect_data in imap_ordered(_inspect, containers, args.concurrency):
+        if inspect_data is not None:
+            yield container, inspect_data
+
+
+def _timestamp(value):
+    # inspection data from the on-disk cache has its timestamps already parsed
+    if isinstance(value, datetime):
+        return value
+    return parse_timestamp(value)
+
+
+def removal_due(inspect_data, args):
+    """
+    Return when the container becomes eligible for removal, or None if no policy applies to it.
     """
-    inspect_data = inspect_container(container, args)
     status = inspect_data["State"]["Status"]
 
     # Note that while a timedelta of zero is a valid value for the created/exited/dead fields,
     # it evaluates to False; hence the "is not None" clauses below.
     if status == "exited" and args.exited is not None:
-        finished_at = parser.parse(inspect_data["State"]["FinishedAt"])
-        if (args.now - finished_at) < args.exited:
-            return False
+        return _timestamp(inspect_data["State"]["FinishedAt"]) + args.exited
     elif status == "created" and args.created is not None:
-        created_at = parser.parse(inspect_data["Created"])
-        if (args.now - created_at) < args.created:
-            return False
+        return _timestamp(inspect_data["Created"]) + args.created
     elif status == "dead" and args.dead is not None:
-        finished_at = parser.parse(inspect_data["State"]["FinishedAt"])
-        if (args.now - finished_at) < args.dead:
-            return False
+        return _timestamp(inspect_data["State"]["FinishedAt"]) + args.dead
     else:
-        return False
+        return None
 
-    return True
 
+def include_container(container, args, inspect_data=None):
+    """
+    Return truthy if container should be removed.
 
-def determine_containers_to_remove(args):
-    return [
-        container for container in all_containers(args)
-        if include_container(container, args)
-    ]
+    Inspection data is fetched on demand unless it has already been retrieved.
+    """
+    if inspect_data is None:
+        inspect_data = inspect_container(container, args)
+
+    due = removal_due(inspect_data, args)
+    return due is not None and due <= args.now
+
+
+def determine_containers_to_remove(args, containers=None):
+    with args.stats.phase("determine_containers_to_remove"):
+        containers = candidate_containers(args, containers)
+        return [
+            container for container, inspect_data in inspect_containers(containers, args)
+            if include_container(container, args, inspect_data)
+        ]
+
+
+def remove_containers(containers, args):
+    """
+    Remove the given containers, returning those that were removed (or would be, in a dry run).
+    """
+    def _remove(container):
+        args.client.remove_container(container["Id"])
+
+    if args.plan is not None:
+        args.plan.record_containers(containers, args)
+
+    removed = []
+    with args.stats.phase("remove_containers"):
+        for container, error, duration in remove_all(containers, _remove, args):
+            reason = args.inspections.get(container["Id"], {}).get("State", {}).get("Status")
+            args.reporter.container(container, reason, error, duration)
+            if error is None:
+                removed.append(container)
+
+    return removed
 
 
 def clean_containers(args):
@@ -82,21 +196,4 @@ def clean_containers(args):
     Images cannot be deleted if in use. Deleting dead containers allows
     more images to be cleaned.
     """
-
-    for container in determine_containers_to_remove(args):
-        print "Removing container ID: {}, Name: {}, Image: {}".format(
-            container["Id"],
-            (container.get("Names") or ["N/A"])[0],
-            container["Image"],
-        )
-
-        if args.dry_run:
-            continue
-
-        try:
-            args.client.remove_container(container["Id"])
-        except APIError as error:
-            print "Unable to remove container: {}: {}".format(
-                container["Id"],
-                error,
-            )
+    remove_containers(determine_containers_to_remove(args), args)
@@ -0,0 +1,127 @@
+"""
+Code to run a subcommand against many Docker daemons at once.
+
+Each daemon gets its own client, inspection cache, statistics and buffered output, and hosts are
+processed concurrently on a bounded pool. A failure on one host (unreachable, TLS problems, API
+errors) is recorded and reported at the end; it doesn't stop the other hosts. Use "--timeout" to
+bound how long a slow host can hold on to a worker.
+"""
+from argparse import ArgumentTypeError
+from collections import namedtuple
+from StringIO import StringIO
+import copy
+import time
+
+from dockerrotate.client import make_client
+from dockerrotate.output import make_reporter
+from dockerrotate.stats import Stats
+from dockerrotate.throttle import make_throttle
+from dockerrotate.workers import imap_ordered
+
+
+HostSpec = namedtuple("HostSpec", ["url", "environment"])
+
+HostResult = namedtuple("HostResult", ["host", "error", "duration", "output", "stats"])
+
+# host options, and the docker environment variables they correspond to
+HOST_OPTIONS = {
+    "tls_verify": "DOCKER_TLS_VERIFY",
+    "cert_path": "DOCKER_CERT_PATH",
+}
+
+
+def host_spec_type(spec):
+    """
+    Parse a host specification of the form "URL [tls_verify=1] [cert_path=PATH]"
+    """
+    parts = spec.split()
+    if not parts:
+        raise ArgumentTypeError("Empty host specification")
+
+    environment = {"DOCKER_HOST": parts[0]}
+    for option in parts[1:]:
+        key, separator, value = option.partition("=")
+        if not separator or key not in HOST_OPTIONS:
+            raise ArgumentTypeError("Invalid host option '{}'".format(option))
+        if key == "tls_verify" and value.lower() in ("", "0", "false", "no"):
+            continue
+        environment[HOST_OPTIONS[key]] = value
+
+    return HostSpec(parts[0], environment)
+
+
+def read_hosts_file(path):
+    """
+    Read host specifications from a file, one per line. Blank lines and comments are ignored.
+    """
+    hosts = []
+    with open(path) as hosts_file:
+        for line_number, line in enumerate(hosts_file, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                hosts.append(host_spec_type(line))
+            except ArgumentTypeError as error:
+                raise SystemExit("Invalid hosts file {}, line {}: {}".format(
+                    path, line_number, error))
+    return hosts
+
+
+def _run_on_host(host, args):
+    output = StringIO()
+    host_args = copy.copy(args)
+    host_args.api_version = None
+    host_args.daemon = None
+    host_args.inspections = {}
+    host_args.inspect_cache = None
+    host_args.stats = Stats()
+    host_args.throttle = make_throttle(host_args)
+    host_args.reporter = make_reporter(args, output, host=host.url)
+
+    started = time.time()
+    error = None
+    try:
+        host_args.client = make_client(host_args, host.environment)
+        if host_args.inspect_cache_path:
+            # only imported when enabled, as the cache pulls in sqlite3
+            from dockerrotate.cache import open_inspection_cache
+
+            host_args.inspect_cache = open_inspection_cache(host_args)
+        host_args.func(host_args)
+        if args.report_stats:
+            host_args.reporter.stats(host_args.stats)
+    except (Exception, SystemExit) as host_error:
+        # Anything can go wrong talking to a remote host; record it and carry on with the rest.
+        error = host_error
+    finally:
+        if host_args.inspect_cache is not None:
+            host_args.inspect_cache.save()
+        host_args.reporter.close()
+
+    return HostResult(host, error, time.time() - started, output.getvalue(), host_args.stats)
+
+
+def run_on_hosts(args):
+    """
+    Run the selected subcommand against every host in args.hosts, then report per-host results.
+
+    Exits with a non-zero status if any host failed.
+    """
+    results = []
+    for result in imap_ordered(lambda host: _run_on_host(host, args), args.hosts,
+                               args.host_concurrency):
+        args.reporter.host_output(result.host.url, result.output)
+        args.stats.merge(result.stats)
+        results.append(result)
+
+    for result in results:
+        args.reporter.host(result.host.url, result.error, result.duration)
+    args.reporter.close()
+
+    if args.prometheus_textfile:
+        args.stats.write_prometheus_textfile(args.prometheus_textfile)
+
+    failed = [result for result in results if result.error is not None]
+    if failed:
+        raise SystemExit("{} of {} hosts failed".format(len(failed), len(results)))
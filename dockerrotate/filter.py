@@ -1,26 +1,166 @@
 """
-Contains functions used in implementing image name filtering.
+Contains functions used in implementing image name, tag and label filtering.
 """
 import re
 
 
-def regex_positive_match(pattern, value):
+def _split_patterns(patterns):
     """
-    Return False if the regex is "positive" and is NOT a complete match for
-    the supplied value, True otherwise.
+    Split patterns into positive and (un-prefixed) negative expressions.
     """
-    if pattern[0] == '~':
-        # this is a negative regex, ignore
-        return True
-    return re.match(pattern + '\Z', value)
+    positive = [pattern for pattern in patterns if pattern[0] != '~']
+    negative = [pattern[1:] for pattern in patterns if pattern[0] == '~']
+    return positive, negative
 
 
-def regex_negative_match(pattern, value):
+def _combine(patterns, template, separator):
     """
-    Return False if the regex is "negative" and is a complete match for the
-    supplied value, True otherwise.
+    Return a single compiled expression for the patterns, or None if they can't be combined.
+
+    Patterns with groups can't safely be combined: group numbers would shift and group names
+    might collide. Nor can patterns with inline flags, such as "(?i)", which would apply to the
+    whole combined expression.
+    """
+    default_flags = re.compile("").flags
+    for pattern in patterns:
+        compiled = re.compile(pattern)
+        if compiled.groups or compiled.flags != default_flags:
+            return None
+    try:
+        return re.compile(separator.join(template.format(pattern) for pattern in patterns))
+    except re.error:
+        return None
+
+
+def _compile_all(patterns):
+    """
+    Return a function that is truthy if the value fully matches ALL of the patterns.
+    """
+    if not patterns:
+        return lambda value: True
+
+    # a sequence of lookaheads, all anchored at the start of the value
+    combined = _combine(patterns, r'(?=(?:{})\Z)', '')
+    if combined is not None:
+        return combined.match
+
+    compiled = [re.compile(r'(?:{})\Z'.format(pattern)) for pattern in patterns]
+    return lambda value: all(expression.match(value) for expression in compiled)
+
+
+def _compile_any(patterns):
     """
-    if pattern[0] != '~':
-        # this is a positive regex, ignore
-        return True
-    return not re.match(pattern[1:] + '\Z', value)
+    Return a function that is truthy if the value fully matches ANY of the patterns.
+    """
+    if not patterns:
+        return lambda value: False
+
+    combined = _combine(patterns, r'(?:{})\Z', '|')
+    if combined is not None:
+        return combined.match
+
+    compiled = [re.compile(r'(?:{})\Z'.format(pattern)) for pattern in patterns]
+    return lambda value: any(expression.match(value) for expression in compiled)
+
+
+class ImageFilter(object):
+    """
+    Name and tag filters, compiled once from the "--name" and "--tag" arguments.
+
+    Patterns must fully match. Patterns with a '~' prefix are negative: an image name/tag
+    that fully matches one of them is rejected.
+    """
+
+    def __init__(self, name_patterns, tag_patterns):
+        positive_names, negative_names = _split_patterns(name_patterns)
+        positive_tags, negative_tags = _split_patterns(tag_patterns)
+
+        self._name_accepted = _compile_all(positive_names)
+        self._tag_accepted = _compile_all(positive_tags)
+        self._name_rejected = _compile_any(negative_names)
+        self._tag_rejected = _compile_any(negative_tags)
+
+    def matcher(self, names, tags):
+        """
+        Return a function that tells whether an image may be considered for deletion, given its
+        (name number, tag number) pairs, which refer to the given lists of names and tags (e.g.
+        those of an ImageSnapshot).
+
+        Images can have multiple names. Allow deletion if:
+         - ANY of the names (and its tag) matches all of the positive expressions
+         - NONE of the names (or tags) match any of the negative expressions
+
+        Each distinct name and tag is evaluated once, up front, since the same names and tags
+        recur across many images.
+        """
+        name_verdicts = [(bool(self._name_accepted(name)), bool(self._name_rejected(name)))
+                         for name in names]
+        tag_verdicts = [(bool(self._tag_accepted(tag)), bool(self._tag_rejected(tag)))
+                        for tag in tags]
+
+        def matches(name_tags):
+            any_accepted = False
+            for name_number, tag_number in name_tags:
+                name_accepted, name_rejected = name_verdicts[name_number]
+                tag_accepted, tag_rejected = tag_verdicts[tag_number]
+                if name_rejected or tag_rejected:
+                    return False
+                any_accepted = any_accepted or (name_accepted and tag_accepted)
+            return any_accepted
+
+        return matches
+
+
+def _compile_label_expression(expression):
+    """
+    Split a "KEY" or "KEY=VALUE" expression into the key and a function that matches values.
+    """
+    key, separator, pattern = expression.partition("=")
+    if not separator:
+        return key, lambda value: True
+    return key, re.compile(r'(?:{})\Z'.format(pattern)).match
+
+
+class LabelFilter(object):
+    """
+    Label filters, compiled once from the "--label" arguments.
+
+    An expression is either KEY, which matches images that have the label, or KEY=VALUE, which
+    matches images whose label value fully matches the (python) regular expression VALUE.
+    Expressions with a '~' prefix are negative: images that match one of them are rejected.
+    """
+
+    def __init__(self, expressions):
+        positive, negative = _split_patterns(expressions)
+        self._positive = [_compile_label_expression(expression) for expression in positive]
+        self._negative = [_compile_label_expression(expression) for expression in negative]
+
+    @staticmethod
+    def _matching(snapshot, key, value_matches):
+        """
+        Return the positions of the images in the snapshot that match an expression.
+        """
+        return set(position
+                   for value, positions in snapshot.labels.get(key, {}).iteritems()
+                   if value_matches(value)
+                   for position in positions)
+
+    def selected(self, snapshot):
+        """
+        Return the positions of the images in an ImageSnapshot that may be considered for
+        deletion: those that match ALL of the positive expressions, and NONE of the negative
+        ones. Each distinct label value is only matched once.
+
+        Returns None if there are no expressions, i.e. every image may be considered.
+        """
+        if not self._positive and not self._negative:
+            return None
+
+        if self._positive:
+            selected = set.intersection(*[self._matching(snapshot, key, value_matches)
+                                          for key, value_matches in self._positive])
+        else:
+            selected = set(xrange(len(snapshot)))
+        for key, value_matches in self._negative:
+            selected -= self._matching(snapshot, key, value_matches)
+        return selected
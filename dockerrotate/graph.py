@@ -0,0 +1,115 @@
+"""
+The parent/child graph of images, used to plan the removal of tagged images.
+
+Removing an image only frees its layers if none of its descendants survive: an image with a
+child that is kept (or in use) merely loses its tags, and stays behind as an intermediate image.
+Conversely, removing the last child of an untagged intermediate image lets the daemon prune that
+intermediate image as well.
+
+From the full image list (including intermediate images), we work out which of the images to be
+removed will really be deleted, and which can only be untagged. Images are removed in waves,
+descendants before ancestors, so that an image is never deleted while its children are still
+being removed.
+"""
+from collections import defaultdict, namedtuple
+
+from dockerrotate.untagged import is_dangling
+
+
+# waves: lists of images to remove, deepest (leaves) first; images in a wave are independent
+# untag_only: Ids of images that will keep a descendant, and can only lose their tags
+# reclaimable: bytes that removing each image is projected to free, by Id
+RemovalPlan = namedtuple("RemovalPlan", ["waves", "untag_only", "reclaimable"])
+
+
+class ImageGraph(object):
+
+    def __init__(self, images):
+        self.order = [image["Id"] for image in images]
+        self.images = dict((image["Id"], image) for image in images)
+        self.children = defaultdict(list)
+        for image in images:
+            if image.get("ParentId") in self.images:
+                self.children[image["ParentId"]].append(image["Id"])
+        self._depths = None
+
+    def remove(self, image_ids):
+        """
+        Drop images that have been removed from the graph.
+        """
+        image_ids = set(image_ids)
+        for image_id in image_ids:
+            image = self.images.pop(image_id, None)
+            if image is not None and image.get("ParentId") in self.children:
+                self.children[image["ParentId"]].remove(image_id)
+        self.order = [image_id for image_id in self.order if image_id not in image_ids]
+        self._depths = None
+
+    def is_top_level(self, image_id):
+        """
+        Return True if the image is listed by the daemon by default, i.e. without all=True.
+
+        That's every image except the untagged ones with children (intermediate images).
+        """
+        return not self.children.get(image_id) or not is_dangling(self.images[image_id])
+
+    def top_level_images(self):
+        return [self.images[image_id] for image_id in self.order if self.is_top_level(image_id)]
+
+    def depths(self):
+        """
+        Return the distance of each image from its oldest listed ancestor, by Id.
+        """
+        if self._depths is None:
+            self._depths = {}
+            pending = [image_id for image_id in self.order
+                       if self.images[image_id].get("ParentId") not in self.images]
+            depth = 0
+            while pending:
+                for image_id in pending:
+                    self._depths[image_id] = depth
+                pending = [child for image_id in pending for child in self.children[image_id]]
+                depth += 1
+        return self._depths
+
+    def plan(self, images_to_remove, keep_ids, sizes):
+        """
+        Plan the removal of the given images, keeping the images in keep_ids (e.g. those in use).
+
+        sizes are the bytes each image holds on its own, by Id; see find_unique_sizes.
+        """
+        removing = set(image["Id"] for image in images_to_remove)
+        depths = self.depths()
+
+        # an image goes away if all of its children do, and it's either being removed or is an
+        # intermediate image the daemon will prune
+        doomed = set()
+        for image_id in sorted(self.images, key=depths.get, reverse=True):
+            if image_id in keep_ids or \
+                    (image_id not in removing and self.is_top_level(image_id)):
+                continue
+            if all(child in doomed for child in self.children.get(image_id, ())):
+                doomed.add(image_id)
+
+        untag_only = removing - doomed
+
+        # charge each intermediate image that goes away to the (first) removal that prunes it
+        reclaimable = {}
+        charged = set()
+        for image in images_to_remove:
+            reclaimed = 0
+            image_id = image["Id"]
+            while image_id in doomed and image_id not in charged:
+                charged.add(image_id)
+                reclaimed += sizes.get(image_id, 0)
+                image_id = self.images[image_id].get("ParentId")
+                if image_id in removing:
+                    break
+            reclaimable[image["Id"]] = reclaimed
+
+        waves = defaultdict(list)
+        for image in images_to_remove:
+            waves[depths.get(image["Id"], 0)].append(image)
+
+        return RemovalPlan([waves[depth] for depth in sorted(waves, reverse=True)],
+                           untag_only, reclaimable)
@@ -20,134 +20,231 @@ would simplify the code and might improve runtime a hair, then the tool would ge
 even when functioning as intended - not a good practice for a tool, as that makes it difficult to
 detect real errors.
 """
-from collections import defaultdict
+import calendar
+import heapq
+import time
 
 from docker.errors import APIError
 
 from dockerrotate.containers import all_containers
-from dockerrotate.filter import regex_positive_match, regex_negative_match
+from dockerrotate.filter import ImageFilter, LabelFilter
+from dockerrotate.graph import ImageGraph
+from dockerrotate.removal import remove_all
+from dockerrotate.snapshot import ImageSnapshot
+from dockerrotate.untagged import is_dangling
 
 
 def determine_images_to_remove(images, containers, args):
     # Accept images and containers as inputs to make this easier to test
 
-    # see docstring for explanation of what's going on here.
-    image_ids_to_keep = find_image_ids_to_keep(images, args)
-    image_ids_in_use = _find_image_ids_in_use(containers)
-
-    def matches_filters(image):
-        # Images can have multiple names. Allow deletion if:
-        #  - ANY of the names matches all of the positive expressions
-        #  - ALL of the names pass (i.e don't match ALL of the negative expressions
+    with args.stats.phase("determine_images_to_remove"):
+        # see docstring for explanation of what's going on here.
+        snapshot = ImageSnapshot(images)
+        positions_to_keep = find_images_to_keep(snapshot, args)
+        positions_in_use = snapshot.positions(_find_image_ids_in_use(containers))
 
-        def positive_check(name, tag):
-            # return true if the name and tag are accepted by all positive regexes
-            return (all(regex_positive_match(name_pattern, name) for name_pattern in args.name) and
-                    all(regex_positive_match(tag_pattern, tag) for tag_pattern in args.tag))
+        matches_filters = ImageFilter(args.name, args.tag).matcher(snapshot.names, snapshot.tags)
+        positions_selected = LabelFilter(args.label).selected(snapshot)
 
-        def negative_check(name, tag):
-            # return true if the name and tag aren't rejected by any of the negative regexes
-            return (all(regex_negative_match(name_pattern, name) for name_pattern in args.name) and
-                    all(regex_negative_match(tag_pattern, tag) for tag_pattern in args.tag))
+        return [snapshot.images[position]
+                for position, name_tags in enumerate(snapshot.name_tags)
+                if position not in positions_to_keep and
+                position not in positions_in_use and
+                (positions_selected is None or position in positions_selected) and
+                matches_filters(name_tags)]
 
-        name_tags = [(normalize_tag_name(name_tag), tag_value(name_tag))
-                     for name_tag in image["RepoTags"]]
 
-        return any(positive_check(name, tag) for name, tag in name_tags) and \
-            all(negative_check(name, tag) for name, tag in name_tags)
-
-    return [image for image in images
-            if image["Id"] not in image_ids_to_keep and
-            image["Id"] not in image_ids_in_use and
-            matches_filters(image)]
+def find_images_to_keep(snapshot, args):
+    """
+    Return the positions in the snapshot of the images to keep under "--keep".
 
+    Images are grouped by name, or with "--keep-by-label", by the value of that label (images
+    without the label are still grouped by name).
 
-def find_image_ids_to_keep(images, args):
+    With "--max-age", only images created within that time count towards "--keep"; with
+    "--min-age", every image created within that time is kept as well.
+    """
     number_to_keep = args.keep
+    now = calendar.timegm(args.now.utctimetuple())
+    created = snapshot.created
+
+    positions_to_keep = set()
+    if args.min_age is not None:
+        min_age_cutoff = now - args.min_age.total_seconds()
+        positions_to_keep.update(position for position, image_created in enumerate(created)
+                                 if image_created > min_age_cutoff)
 
-    # Need a special case for keep = 0; below, we use a [-number:] range on a list to
-    # pick out the items to keep, and that doesn't work with a zero, because -0 == 0.
-    # Luckily, the zero case is easy to calculate..
     if number_to_keep == 0:
-        return set()
+        return positions_to_keep
+
+    max_age_cutoff = None
+    if args.max_age is not None:
+        max_age_cutoff = now - args.max_age.total_seconds()
+
+    label_values = {}
+    if args.keep_by_label:
+        label_values = snapshot.label_values(args.keep_by_label)
+
+    # For each group, keep a min-heap of the newest N images seen so far, so memory
+    # scales with the number of groups rather than the number of images. Entries are
+    # (Created, position): ties on Created go to the image listed last, as they would
+    # when stable-sorting by Created and taking the last N.
+    newest_by_group = {}
+    last_position_by_group = {}
+    for position, name_tags in enumerate(snapshot.name_tags):
+        if max_age_cutoff is not None and created[position] < max_age_cutoff:
+            # too old to be kept; the newest N younger images in its groups are kept instead
+            continue
+        entry = (created[position], position)
+
+        if position in label_values:
+            groups = [("label", label_values[position])]
+        else:
+            # each RepoTag produces a name; these are usually the same but can be different.
+            groups = [name_number for name_number, _ in name_tags]
 
-    images_by_name = defaultdict(list)
-    for image in images:
-        # each RepoTag produces a name; these are usually the same but can be different.
-        image_names = set(normalize_tag_name(name_tag) for name_tag in image["RepoTags"])
-        for image_name in image_names:
-            images_by_name[image_name].append(image)
+        for group in groups:
+            if last_position_by_group.get(group) == position:
+                continue
+            last_position_by_group[group] = position
 
-    all_ids_to_keep = set()
-    for image_name, images_with_name in images_by_name.items():
-        images_to_keep = sorted(images_with_name,
-                                key=lambda image: image["Created"])[-number_to_keep:]
-        all_ids_to_keep.update(image["Id"] for image in images_to_keep)
+            newest = newest_by_group.setdefault(group, [])
+            if len(newest) < number_to_keep:
+                heapq.heappush(newest, entry)
+            elif entry > newest[0]:
+                heapq.heapreplace(newest, entry)
 
-    return all_ids_to_keep
+    positions_to_keep.update(position
+                             for newest in newest_by_group.values()
+                             for _, position in newest)
+    return positions_to_keep
 
 
 def _find_image_ids_in_use(containers):
     return set(container["ImageID"] for container in containers)
 
 
-def clean_images(args):
-    """
-    Main entry point - delete old images keeping the most recent N images by tag.
+def find_unique_sizes(images):
     """
+    Return the number of bytes, by image Id, that each image holds on its own.
 
-    # should not need to inspect all images; only intermediate images should appear
-    # when all is true; these should be deleted along with dependent images
-    images = args.client.images(all=False)
-    containers = all_containers(args)
+    The size the daemon reports for an image includes its parent images, so the bytes that
+    removing an image frees are its size less its parent's size. Images whose parent isn't
+    listed (e.g. pulled images) are charged their full size.
+    """
+    sizes = dict((image["Id"], image.get("VirtualSize", image.get("Size", 0)))
+                 for image in images)
+    return dict((image["Id"], max(0, sizes[image["Id"]] - sizes.get(image.get("ParentId"), 0)))
+                for image in images)
 
-    images_to_remove = determine_images_to_remove(images, containers, args)
 
-    for image in images_to_remove:
-        print "Removing image ID: {}, Tags: {}".format(
-            image["Id"],
-            ", ".join(image["RepoTags"])
-        )
+def limit_to_target(images_to_remove, sizes, target):
+    """
+    Return the oldest of the images whose removal is projected to reclaim `target` bytes.
 
-        if args.dry_run:
-            continue
+    If there's no target, all of the images are returned, in their original order.
+    """
+    if target is None:
+        return images_to_remove
 
-        try:
-            # The simplest way to do this would be to delete by ID. However, then we
-            # encounter issues in the case where we have an image A that is tagged for
-            # removal, but that image is a parent image for image B. The desired behavior
-            # in that case is that all tags are removed for that image, but the image
-            # itself remains until B is removed.
-            #
-            # force=true is required here because the image we remove might be "latest".
-
-            for repo_tag in image["RepoTags"]:
-                args.client.remove_image(repo_tag, force=True, noprune=False)
-            else:
-                # If the image has no tags (unexpected), fall back to ID.
-                args.client.remove_image(image["Id"], force=True, noprune=False)
-        except APIError as error:
-            print "unexpected: API error while trying to delete image. Error message is:"
-            print error.message
+    selected, projected = [], 0
+    for image in sorted(images_to_remove, key=lambda image: image["Created"]):
+        if projected >= target:
+            break
+        selected.append(image)
+        projected += sizes.get(image["Id"], 0)
+    return selected
 
 
-def normalize_tag_name(name_tag):
+def plan_image_removal(images_to_remove, graph, containers, args):
     """
-    docker-py provides "RepoTags", which are strings of format "<image name>:<image tag>"
+    Plan the removal of the given tagged images, stopping at args.target_free if it's set.
+    """
+    image_ids_in_use = _find_image_ids_in_use(containers)
+    sizes = find_unique_sizes(graph.images.values())
+    plan = graph.plan(images_to_remove, image_ids_in_use, sizes)
+    if args.target_free is not None:
+        images_to_remove = limit_to_target(images_to_remove, plan.reclaimable, args.target_free)
+        plan = graph.plan(images_to_remove, image_ids_in_use, sizes)
+    return plan
 
-    We want to strip off the tag part and normalize the name:
 
-       some.domain.com/organization/image:tag -> organization/image
-                       organization/image:tag -> organization/image
-                                    image:tag ->              image
+def remove_images(plan, args):
     """
-    return "/".join(name_tag.rsplit(":", 1)[0].split("/")[-2:])
+    Remove the tagged images in a removal plan, reporting projected and actual reclaimed space.
+    """
+    def _untag(image):
+        # force=true is required here because the image we remove might be "latest".
+        for repo_tag in _unique_tags(image):
+            args.client.remove_image(repo_tag, force=True, noprune=False)
+
+    def _remove(image):
+        # Deleting by ID removes every tag (and digest reference) in one call, but fails for an
+        # image A that is tagged for removal while it is the parent of an image B that we keep.
+        # The desired behavior in that case is that all tags are removed for that image, but
+        # the image itself remains until B is removed. The plan tells us which images those are;
+        # if another image turns out to depend on one we expected to delete, we untag it instead.
+        tags = _unique_tags(image)
+        calls = len(tags)
+        if image["Id"] in plan.untag_only:
+            _untag(image)
+        else:
+            try:
+                args.client.remove_image(image["Id"], force=True, noprune=False)
+                calls = 1
+            except APIError as error:
+                if error.response.status_code != 409:
+                    raise
+                _untag(image)
+                calls = len(tags) + 1
+        # we used to untag every tag and then delete by ID
+        args.stats.count("image_removal_calls_saved", len(image["RepoTags"]) + 1 - calls)
+
+    if args.plan is not None:
+        args.plan.record_images(plan)
+
+    args.reporter.projected("image", sum(len(wave) for wave in plan.waves),
+                            sum(plan.reclaimable.values()))
+
+    started = time.time()
+    removed, reclaimed = 0, 0
+    with args.stats.phase("remove_images"):
+        # each wave only starts once the images in the previous one (their descendants) are gone
+        for wave in plan.waves:
+            for image, error, duration in remove_all(wave, _remove, args):
+                reason = "untag-only" if image["Id"] in plan.untag_only else "rotated"
+                args.reporter.image(image, reason, error, duration)
+                if error is None:
+                    removed += 1
+                    reclaimed += plan.reclaimable.get(image["Id"], 0)
+
+    if not args.dry_run:
+        args.reporter.reclaimed("image", removed, reclaimed, time.time() - started)
 
 
-def tag_value(name_tag):
+def clean_images(args):
     """
-    docker-py provides "RepoTags", which are strings of format "<image name>:<image tag>"
+    Main entry point - delete old images keeping the most recent N images by tag.
+    """
+
+    # intermediate images are listed too, so that we know which images have children
+    with args.stats.phase("list_images"):
+        graph = ImageGraph(args.client.images(all=True))
+    containers = all_containers(args)
 
-    We want just the part after the colon.
+    # untagged images are left to "untagged-images", with its own policies
+    tagged_images = [image for image in graph.top_level_images()
+                     if image.get("RepoTags") and not is_dangling(image)]
+    images_to_remove = determine_images_to_remove(tagged_images, containers, args)
+    remove_images(plan_image_removal(images_to_remove, graph, containers, args), args)
+
+
+def _unique_tags(image):
+    """
+    Return the image's repo tags, without duplicates or the "<none>:<none>" placeholder.
     """
-    return name_tag.rsplit(":", 1)[1]
+    tags = []
+    for repo_tag in image["RepoTags"]:
+        if repo_tag != "<none>:<none>" and repo_tag not in tags:
+            tags.append(repo_tag)
+    return tags
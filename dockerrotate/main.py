@@ -3,22 +3,31 @@ Free up space by rotating out old Docker images and containers.
 """
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, ArgumentTypeError
 from datetime import datetime, timedelta
+from importlib import import_module
 import re
+import sys
 
 from dateutil.tz import tzutc
-from docker import Client
-from docker.errors import NotFound
-from docker.utils import kwargs_from_env
 
-from dockerrotate.containers import clean_containers
-from dockerrotate.images import clean_images
-from dockerrotate.untagged import clean_untagged
+from dockerrotate.client import make_client
+from dockerrotate.output import make_reporter
+from dockerrotate.fanout import host_spec_type, read_hosts_file, run_on_hosts
+from dockerrotate.stats import Stats
+from dockerrotate.throttle import make_throttle
 
 
 UNIX_SOC_ARGS = {"base_url": "unix://var/run/docker.sock"}
 
 TIME_REGEX = re.compile(r'((?P<days>\d+?)d)?((?P<hours>\d+?)h)?((?P<minutes>\d+?)m)?((?P<seconds>\d+?)s)?')  # noqa
 
+SIZE_REGEX = re.compile(r'(?P<number>\d+)(?P<unit>[kmgt]?)b?\Z', re.IGNORECASE)
+
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+IMAGES_EPILOG = ("Multiple \"--name\", \"--tag\" and \"--label\" arguments can be provided. Only "
+                 "images that match ALL of the supplied expressions will be considered for "
+                 "cleanup.")
+
 
 def time_delta_type(time_str):
     """
@@ -35,57 +44,166 @@ def time_delta_type(time_str):
     return timedelta(**time_params)
 
 
-def argument_parser():
-    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Do not remove anything",
-    )
-    parser.add_argument(
-        "--client-version",
-        help="Specify client version to use.",
-    )
+def size_type(size_str):
+    """
+    Parse a human readable size string (e.g. 512M, 10G) into a number of bytes
+    """
+    parts = SIZE_REGEX.match(size_str)
+    if not parts:
+        raise ArgumentTypeError("Invalid size format '{}'".format(size_str))
+    return int(parts.group("number")) * SIZE_UNITS[parts.group("unit").lower()]
 
-    subparsers = parser.add_subparsers(title="Subcommands")
 
-    images_parser = subparsers.add_parser(
-        "images",
-        help="Clean up old tagged images",
-        formatter_class=ArgumentDefaultsHelpFormatter,
-        epilog="Multiple \"--name\" and \"--tag\" arguments can be provided. Only images that "
-               "match ALL of the supplied expressions will be considered for cleanup."
-    )
-    images_parser.set_defaults(func=clean_images)
-    images_parser.add_argument(
+def positive_int_type(number_str):
+    """
+    Parse a whole number that must be at least 1
+    """
+    try:
+        number = int(number_str)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ArgumentTypeError("Must be a whole number of at least 1: '{}'".format(number_str))
+    return number
+
+
+def positive_float_type(number_str):
+    """
+    Parse a number that must be greater than 0
+    """
+    try:
+        number = float(number_str)
+    except ValueError:
+        number = 0
+    if not number > 0:
+        raise ArgumentTypeError("Must be a number greater than 0: '{}'".format(number_str))
+    return number
+
+
+def _add_image_arguments(parser, keep_required=True):
+    parser.add_argument(
         "--keep",
         "-k",
         type=int,
-        required=True,
+        required=keep_required,
         help="For each image name, keep this many images",
     )
 
-    images_parser.add_argument(
+    parser.add_argument(
         "--name",
         action="append",
         default=[],
         help="Limit cleanup to images whose name fully matches this (python) regular expression. "
              "Use a '~' prefix to invert matching.",
     )
-    images_parser.add_argument(
+    parser.add_argument(
         "--tag",
         action="append",
         default=[],
         help="Limit cleanup to images whose tag fully matches this (python) regular expression. "
              "Use a '~' prefix to invert matching.",
     )
+    parser.add_argument(
+        "--label",
+        action="append",
+        default=[],
+        help="Limit cleanup to images with this label: \"KEY\" for any value, or \"KEY=VALUE\" "
+             "for a value that fully matches this (python) regular expression. Use a '~' prefix "
+             "to invert matching, e.g. \"~rotate.keep=true\" to protect images.",
+    )
+    parser.add_argument(
+        "--keep-by-label",
+        metavar="KEY",
+        help="Apply \"--keep\" to each value of this label, rather than to each image name. "
+             "Images without the label are grouped by name as usual.",
+    )
+    parser.add_argument(
+        "--min-age",
+        type=time_delta_type,
+        help="Only remove images that were created at least this long ago",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=time_delta_type,
+        help="Only images created within this time count towards \"--keep\"; older images are "
+             "removed even if they are among the most recent for their name",
+    )
+    parser.add_argument(
+        "--target-free",
+        type=size_type,
+        help="Stop once removing images is projected to reclaim this much space (e.g. 10G). "
+             "The oldest images are removed first.",
+    )
+
+
+def _add_untagged_arguments(parser):
+    parser.add_argument(
+        "--min-age",
+        type=time_delta_type,
+        help="Only remove untagged images that were created at least this long ago",
+    )
+
+
+def _add_container_arguments(parser):
+    parser.add_argument(
+        "--exited",
+        type=time_delta_type,
+        help="Remove \"exited\" containers that finished at least this long ago",
+    )
+    parser.add_argument(
+        "--created",
+        type=time_delta_type,
+        help="Remove \"created\" containers that were created at least this long ago",
+    )
+    parser.add_argument(
+        "--dead",
+        type=time_delta_type,
+        help="Remove \"dead\" containers that finished at least this long ago",
+    )
+
+
+def load_func(name):
+    """
+    Import the function named "module:function".
+
+    Subcommands name their entry point this way, so that only the selected subcommand's module
+    (and its dependencies) is imported.
+    """
+    module_name, _, func_name = name.partition(":")
+    return getattr(import_module(module_name), func_name)
+
+
+def _set_func(parser, func, planning):
+    if planning:
+        parser.set_defaults(func="dockerrotate.plan:write_plan", plan_func=func)
+    else:
+        parser.set_defaults(func=func)
+
+
+def _add_cleanup_subcommands(subparsers, planning=False):
+    images_parser = subparsers.add_parser(
+        "images",
+        help="Clean up old tagged images",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        epilog=IMAGES_EPILOG,
+    )
+    _set_func(images_parser, "dockerrotate.images:clean_images", planning)
+    _add_image_arguments(images_parser)
 
     untagged_parser = subparsers.add_parser(
         "untagged-images",
         help="Clean out old untagged images",
         formatter_class=ArgumentDefaultsHelpFormatter,
     )
-    untagged_parser.set_defaults(func=clean_untagged)
+    _set_func(untagged_parser, "dockerrotate.untagged:clean_untagged", planning)
+    _add_untagged_arguments(untagged_parser)
+    untagged_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Have the daemon remove unused untagged images in a single request, if supported "
+             "(API 1.25+, or 1.28+ with \"--min-age\"; docker-py uses API 1.24 unless given "
+             "\"--client-version\")",
+    )
 
     containers_parser = subparsers.add_parser(
         "containers",
@@ -93,57 +211,200 @@ def argument_parser():
         formatter_class=ArgumentDefaultsHelpFormatter,
         epilog="The \"exited\", \"created\", and \"dead\" arguments all "
     )
-    containers_parser.set_defaults(func=clean_containers)
-    containers_parser.add_argument(
-        "--exited",
-        type=time_delta_type,
-        help="Remove \"exited\" containers that finished at least this long ago",
+    _set_func(containers_parser, "dockerrotate.containers:clean_containers", planning)
+    _add_container_arguments(containers_parser)
+
+    all_parser = subparsers.add_parser(
+        "all",
+        help="Clean up containers, then untagged images, then tagged images, in a single pass",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        epilog=IMAGES_EPILOG,
     )
-    containers_parser.add_argument(
-        "--created",
+    _set_func(all_parser, "dockerrotate.combined:clean_all", planning)
+    _add_container_arguments(all_parser)
+    # "--min-age" applies to untagged images too
+    _add_image_arguments(all_parser)
+
+
+def argument_parser():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Do not remove anything",
+    )
+    parser.add_argument(
+        "--client-version",
+        help="Specify client version to use.",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["text", "json"],
+        default="text",
+        help="Report removals as text, or as one JSON record per line",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["docker-py", "native"],
+        default="docker-py",
+        help="Talk to the Docker daemon with docker-py, or with a lightweight built-in client "
+             "that keeps a pool of open connections (no TLS support)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        help="Timeout for each request to the Docker daemon, in seconds (default: docker-py's)",
+    )
+    parser.add_argument(
+        "--host",
+        dest="hosts",
+        action="append",
+        type=host_spec_type,
+        default=[],
+        help="Run against this Docker daemon instead of the one configured by the DOCKER_* "
+             "environment variables. May be repeated. Format: \"URL [tls_verify=1] "
+             "[cert_path=PATH]\"",
+    )
+    parser.add_argument(
+        "--hosts-file",
+        help="Read Docker daemons to run against from this file, one per line, in the same "
+             "format as \"--host\"",
+    )
+    parser.add_argument(
+        "--host-concurrency",
+        type=positive_int_type,
+        default=8,
+        help="When running against several Docker daemons, process this many at once",
+    )
+    parser.add_argument(
+        "--stats",
+        dest="report_stats",
+        action="store_true",
+        help="Report Docker API call counts and timings, and time spent in each phase, at exit",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        metavar="PATH",
+        help="Write run statistics to this file in Prometheus text format, e.g. for "
+             "node_exporter's textfile collector",
+    )
+    parser.add_argument(
+        "--max-removals-per-second",
+        type=positive_float_type,
+        help="Start at most this many removals per second",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=positive_int_type,
+        help="Maximum number of removals in progress at once (default: \"--concurrency\")",
+    )
+    parser.add_argument(
+        "--slow-removal-threshold",
+        type=positive_float_type,
+        metavar="SECONDS",
+        help="Back off when a removal takes longer than this: halve the number of removals in "
+             "flight (and the rate), and pause, recovering gradually as removals speed up again",
+    )
+    parser.add_argument(
+        "--inspect-cache",
+        dest="inspect_cache_path",
+        metavar="PATH",
+        help="Keep the inspection facts of stopped containers in this SQLite file between runs, "
+             "so that only new containers are inspected",
+    )
+    parser.add_argument(
+        "--version-cache",
+        dest="version_cache_path",
+        metavar="PATH",
+        help="Remember each Docker daemon's API version in this file between runs, rather than "
+             "asking for it every time",
+    )
+    parser.add_argument(
+        "--version-cache-ttl",
         type=time_delta_type,
-        help="Remove \"created\" containers that were created at least this long ago",
+        default="1h",
+        help="Ask the daemon for its API version again once the cached one is this old",
     )
-    containers_parser.add_argument(
-        "--dead",
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int_type,
+        default=4,
+        help="Maximum number of concurrent requests to the Docker daemon",
+    )
+
+    subparsers = parser.add_subparsers(title="Subcommands")
+
+    _add_cleanup_subcommands(subparsers)
+
+    plan_parser = subparsers.add_parser(
+        "plan",
+        help="Work out what a subcommand would remove, and save it to a plan file for \"apply\"",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    plan_parser.set_defaults(single_host="plan")
+    plan_parser.add_argument(
+        "plan_path",
+        metavar="PLAN",
+        help="File to write the plan to",
+    )
+    _add_cleanup_subcommands(plan_parser.add_subparsers(title="Subcommands"), planning=True)
+
+    apply_parser = subparsers.add_parser(
+        "apply",
+        help="Remove what a plan file made by \"plan\" says, skipping anything that has changed",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    apply_parser.set_defaults(func="dockerrotate.plan:apply_plan", single_host="apply")
+    apply_parser.add_argument(
+        "plan_path",
+        metavar="PLAN",
+        help="Plan file to apply",
+    )
+    apply_parser.add_argument(
+        "--max-plan-age",
         type=time_delta_type,
-        help="Remove \"dead\" containers that finished at least this long ago",
+        help="Refuse to apply a plan made longer ago than this",
     )
 
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Keep running, cleaning up containers and tagged images as Docker events arrive",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        epilog=IMAGES_EPILOG + " Tagged images are only cleaned up if \"--keep\" is given.",
+    )
+    # runs forever, so per-host output would never be reported
+    watch_parser.set_defaults(func="dockerrotate.watch:watch", single_host="watch")
+    _add_container_arguments(watch_parser)
+    _add_image_arguments(watch_parser, keep_required=False)
+
     return parser
 
 
 def parse_arguments(arg_values):
     parser = argument_parser()
     args = parser.parse_args(arg_values)
+    args.func = load_func(args.func)
+    if getattr(args, "plan_func", None):
+        args.plan_func = load_func(args.plan_func)
+        # planning is a dry run; set before the reporter is made, which reports it
+        args.dry_run = True
     args.now = datetime.now(tzutc())
+    # unknown until we've talked to the daemon; see make_client
+    args.api_version = None
+    # the URL of the daemon; see make_client
+    args.daemon = None
+    # container inspection data, by container Id
+    args.inspections = {}
+    # on-disk inspection cache, if enabled; see open_inspection_cache
+    args.inspect_cache = None
+    # records removals instead of making them; see write_plan
+    args.plan = None
+    args.reporter = make_reporter(args, sys.stdout)
+    args.stats = Stats()
+    args.throttle = make_throttle(args)
     return args
 
 
-def make_client(args):
-    """
-    Create a Docker client.
-
-    Either use the local socket (default) or use the standard environment
-    variables (e.g. DOCKER_HOST). This is much simpler than trying to pass
-    all the possible certificate options through argparse.
-    """
-    kwargs = kwargs_from_env(assert_hostname=False)
-
-    if args.client_version:
-        kwargs["version"] = args.client_version
-
-    client = Client(**kwargs)
-
-    # Verify client can talk to server.
-    try:
-        client.version()
-    except NotFound as error:
-        raise SystemExit(error)
-
-    return client
-
-
 def main(arg_values=None):
     """
     CLI entry point.
@@ -151,6 +412,29 @@ def main(arg_values=None):
     """
     args = parse_arguments(arg_values)
 
+    if args.hosts_file:
+        args.hosts.extend(read_hosts_file(args.hosts_file))
+    if args.hosts:
+        if getattr(args, "single_host", None):
+            raise SystemExit("\"{}\" can only be run against a single Docker daemon".format(
+                args.single_host))
+        run_on_hosts(args)
+        return
+
     args.client = make_client(args)
+    if args.inspect_cache_path:
+        # only imported when enabled, as the cache pulls in sqlite3
+        from dockerrotate.cache import open_inspection_cache
 
-    args.func(args)
+        args.inspect_cache = open_inspection_cache(args)
+
+    try:
+        args.func(args)
+    finally:
+        if args.inspect_cache is not None:
+            args.inspect_cache.save()
+        if args.report_stats:
+            args.reporter.stats(args.stats)
+        args.reporter.close()
+        if args.prometheus_textfile:
+            args.stats.write_prometheus_textfile(args.prometheus_textfile)
@@ -0,0 +1,206 @@
+"""
+Reporting of removal decisions, either as human readable text or as newline-delimited JSON.
+
+Every removal candidate is reported exactly once, in order, after its removal was attempted.
+"""
+import json
+
+
+class TextReporter(object):
+    """
+    Report removals as free-form text, one or more lines per object.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def container(self, container, reason, error, duration):
+        print >> self.stream, "Removing container ID: {}, Name: {}, Image: {}".format(
+            container["Id"],
+            (container.get("Names") or ["N/A"])[0],
+            container["Image"],
+        )
+
+        if error is not None:
+            print >> self.stream, "Unable to remove container: {}: {}".format(
+                container["Id"],
+                error,
+            )
+
+    def image(self, image, reason, error, duration):
+        print >> self.stream, "Removing image ID: {}, Tags: {}".format(
+            image["Id"],
+            ", ".join(image["RepoTags"])
+        )
+
+        if error is not None:
+            print >> self.stream, \
+                "unexpected: API error while trying to delete image. Error message is:"
+            print >> self.stream, error.message
+
+    def untagged_image(self, image, reason, error, duration):
+        print >> self.stream, "Removing untagged image with Id: {}".format(image["Id"])
+
+        if error is not None:
+            print >> self.stream, \
+                "unexpected: API error while trying to delete untagged image. Error message is:"
+            print >> self.stream, error.message
+
+    def projected(self, kind, count, size):
+        print >> self.stream, "Projected to reclaim {} bytes by removing {} {}(s)".format(
+            size, count, kind.replace("-", " "))
+
+    def reclaimed(self, kind, count, size, duration):
+        print >> self.stream, "Removed {} {}(s) in {:.1f}s, reclaiming {} bytes".format(
+            count, kind.replace("-", " "), duration, size)
+
+    def stats(self, stats):
+        print >> self.stream, "Docker API calls:"
+        for endpoint, count in sorted(stats.calls.items()):
+            print >> self.stream, "  {:<24} {:>8} calls {:>10.3f}s".format(
+                endpoint, count, stats.call_seconds[endpoint])
+        print >> self.stream, "Phases:"
+        for name in stats.phases:
+            print >> self.stream, "  {:<32} {:>10.3f}s".format(name, stats.phase_seconds[name])
+        if stats.counters:
+            print >> self.stream, "Counters:"
+            for name, value in sorted(stats.counters.items()):
+                print >> self.stream, "  {:<32} {:>10}".format(name, value)
+
+    def host_output(self, host, output):
+        for line in output.splitlines():
+            print >> self.stream, "[{}] {}".format(host, line)
+
+    def host(self, host, error, duration):
+        if error is None:
+            print >> self.stream, "Host {}: succeeded in {:.1f}s".format(host, duration)
+        else:
+            print >> self.stream, "Host {}: failed after {:.1f}s: {}".format(host, duration, error)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class JsonReporter(object):
+    """
+    Report removals as newline-delimited JSON records.
+
+    Records are buffered and written to the stream in large chunks rather than one write
+    per object.
+    """
+
+    def __init__(self, stream, dry_run, host=None, buffer_size=64 * 1024):
+        self.stream = stream
+        self.dry_run = dry_run
+        self.host = host
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+
+    def _action(self, error):
+        if self.dry_run:
+            return "dry-run"
+        return "removed" if error is None else "failed"
+
+    def _write(self, record):
+        if self.host is not None:
+            record["host"] = self.host
+        line = json.dumps(record, sort_keys=True) + "\n"
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def container(self, container, reason, error, duration):
+        self._write(dict(
+            kind="container",
+            id=container["Id"],
+            names=container.get("Names") or [],
+            image=container["Image"],
+            reason=reason,
+            action=self._action(error),
+            duration=duration,
+            error=None if error is None else str(error),
+        ))
+
+    def image(self, image, reason, error, duration):
+        self._write(dict(
+            kind="image",
+            id=image["Id"],
+            tags=list(image["RepoTags"]),
+            reason=reason,
+            action=self._action(error),
+            duration=duration,
+            error=None if error is None else str(error),
+        ))
+
+    def untagged_image(self, image, reason, error, duration):
+        self._write(dict(
+            kind="untagged-image",
+            id=image["Id"],
+            tags=[],
+            reason=reason,
+            action=self._action(error),
+            duration=duration,
+            error=None if error is None else str(error),
+        ))
+
+    def projected(self, kind, count, size):
+        self._write(dict(
+            kind="plan",
+            removed_kind=kind,
+            count=count,
+            projected=size,
+        ))
+
+    def reclaimed(self, kind, count, size, duration):
+        self._write(dict(
+            kind="summary",
+            removed_kind=kind,
+            count=count,
+            reclaimed=size,
+            duration=duration,
+        ))
+
+    def stats(self, stats):
+        self._write(dict(
+            kind="stats",
+            calls=dict(stats.calls),
+            call_seconds=dict(stats.call_seconds),
+            phase_seconds=dict(stats.phase_seconds),
+            counters=dict(stats.counters),
+        ))
+
+    def host_output(self, host, output):
+        # records from each host are already tagged with the host
+        self._buffer.append(output)
+        self._buffered += len(output)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def host(self, host, error, duration):
+        self._write(dict(
+            kind="host",
+            host=host,
+            status="succeeded" if error is None else "failed",
+            duration=duration,
+            error=None if error is None else str(error),
+        ))
+
+    def flush(self):
+        self.stream.write("".join(self._buffer))
+        self.stream.flush()
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+
+
+def make_reporter(args, stream, host=None):
+    if args.output == "json":
+        return JsonReporter(stream, args.dry_run, host=host)
+    return TextReporter(stream)
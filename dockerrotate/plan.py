@@ -0,0 +1,170 @@
+"""
+Code to split cleanup into a "plan" step, which decides what to remove and writes it to a file,
+and an "apply" step, which removes it.
+
+"docker-rotate plan PATH SUBCOMMAND ..." runs the subcommand exactly like a dry run (listing,
+inspecting, applying the retention policies), and records every removal it would make. The plan
+can be reviewed, and later applied with "docker-rotate apply PATH", which skips all of that
+discovery work. Applying only makes cheap staleness checks against a fresh listing of containers
+and images:
+
+ - containers and images that no longer exist are skipped
+ - containers whose state has changed (where the daemon reports it in the list) are skipped
+ - images that have gained tags (including untagged images that have been tagged since), or are
+   now used by a container, are skipped
+"""
+from datetime import datetime
+import json
+import os
+
+from dateutil.tz import tzutc
+
+from dockerrotate.compat import api_version_at_least
+from dockerrotate.containers import all_containers, remove_containers
+from dockerrotate.graph import RemovalPlan
+from dockerrotate.images import remove_images
+from dockerrotate.timestamps import parse_timestamp
+from dockerrotate.untagged import is_dangling, remove_untagged_images
+
+
+PLAN_FORMAT_VERSION = 1
+
+
+class PlanRecorder(object):
+    """
+    Collects the removals made during a planning run.
+    """
+
+    def __init__(self):
+        self.containers = []
+        self.untagged_images = []
+        self.image_waves = []
+        self.untag_only = set()
+        self.reclaimable = {}
+
+    def record_containers(self, containers, args):
+        for container in containers:
+            inspect_data = args.inspections.get(container["Id"], {})
+            self.containers.append(dict(
+                Id=container["Id"],
+                Image=container["Image"],
+                Names=container.get("Names") or [],
+                Status=inspect_data.get("State", {}).get("Status"),
+            ))
+
+    def record_untagged_images(self, images):
+        self.untagged_images.extend(dict(Id=image["Id"], Size=image.get("Size", 0))
+                                    for image in images)
+
+    def record_images(self, plan):
+        for wave in plan.waves:
+            self.image_waves.append([dict(Id=image["Id"], RepoTags=list(image["RepoTags"]),
+                                          Created=image["Created"])
+                                     for image in wave])
+        self.untag_only.update(plan.untag_only)
+        self.reclaimable.update(plan.reclaimable)
+
+    def to_json(self, args):
+        return dict(
+            version=PLAN_FORMAT_VERSION,
+            created=args.now.isoformat(),
+            daemon=args.daemon,
+            api_version=args.api_version,
+            containers=self.containers,
+            untagged_images=self.untagged_images,
+            images=dict(
+                waves=self.image_waves,
+                untag_only=sorted(self.untag_only),
+                reclaimable=self.reclaimable,
+            ),
+        )
+
+
+def write_plan(args):
+    """
+    Main entry point for "plan": run the selected subcommand as a dry run, and save its removals.
+    """
+    # args.dry_run was set by parse_arguments
+    args.plan = PlanRecorder()
+    args.plan_func(args)
+
+    temporary_path = "{}.{}.tmp".format(args.plan_path, os.getpid())
+    with open(temporary_path, "w") as plan_file:
+        json.dump(args.plan.to_json(args), plan_file, indent=1, sort_keys=True)
+    os.rename(temporary_path, args.plan_path)
+
+
+def read_plan(path):
+    with open(path) as plan_file:
+        plan = json.load(plan_file)
+    if plan.get("version") != PLAN_FORMAT_VERSION:
+        raise SystemExit("Unsupported plan format version: {}".format(plan.get("version")))
+    return plan
+
+
+def _check_plan(plan, args):
+    daemon = args.daemon
+    if plan["daemon"] != daemon:
+        raise SystemExit("The plan was made for the Docker daemon at {}, not {}".format(
+            plan["daemon"], daemon))
+
+    age = datetime.now(tzutc()) - parse_timestamp(plan["created"])
+    if args.max_plan_age is not None and age > args.max_plan_age:
+        raise SystemExit("The plan is too old to apply: it was made {} ago".format(age))
+
+
+def apply_plan(args):
+    """
+    Main entry point for "apply": remove what a plan file says, unless it has become stale.
+    """
+    plan = read_plan(args.plan_path)
+    _check_plan(plan, args)
+
+    # on API 1.23+ the list includes each container's state
+    containers = dict((container["Id"], container) for container in all_containers(args))
+    with args.stats.phase("list_images"):
+        images = dict((image["Id"], image) for image in args.client.images(all=True))
+    with_state = api_version_at_least(args, "1.23")
+
+    def _container_current(container):
+        listed = containers.get(container["Id"])
+        return listed is not None and \
+            (not with_state or listed.get("State") == container["Status"])
+
+    planned_containers = [container for container in plan["containers"]
+                          if _container_current(container)]
+    args.stats.count("stale_plan_entries", len(plan["containers"]) - len(planned_containers))
+    for container in planned_containers:
+        # removals are reported with the status the container was planned for
+        args.inspections[container["Id"]] = dict(State=dict(Status=container["Status"]))
+    for container in remove_containers(planned_containers, args):
+        containers.pop(container["Id"], None)
+
+    image_ids_in_use = set(container["ImageID"] for container in containers.values())
+
+    def _image_current(image):
+        listed = images.get(image["Id"])
+        return listed is not None and image["Id"] not in image_ids_in_use and \
+            set(listed.get("RepoTags") or []) <= set(image["RepoTags"])
+
+    def _untagged_current(image):
+        listed = images.get(image["Id"])
+        # removing a tagged image by Id would delete it along with its tag
+        return listed is not None and image["Id"] not in image_ids_in_use and \
+            is_dangling(listed)
+
+    planned_untagged = [image for image in plan["untagged_images"] if _untagged_current(image)]
+    args.stats.count("stale_plan_entries",
+                     len(plan["untagged_images"]) - len(planned_untagged))
+    if planned_untagged:
+        remove_untagged_images(planned_untagged, args)
+
+    waves = []
+    for wave in plan["images"]["waves"]:
+        current = [image for image in wave if _image_current(image)]
+        args.stats.count("stale_plan_entries", len(wave) - len(current))
+        if current:
+            waves.append(current)
+    if waves:
+        remove_images(RemovalPlan(waves, set(plan["images"]["untag_only"]),
+                                  plan["images"]["reclaimable"]), args)
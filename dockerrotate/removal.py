@@ -0,0 +1,33 @@
+"""
+Removal executor shared by the containers, images and untagged-images subcommands.
+
+Removals are spread over the same bounded worker pool used for inspection, and paced by the
+run's throttle (see throttle.py). Results come back in the order the objects were supplied, so
+output reads exactly as it would for a serial run.
+"""
+import time
+
+from docker.errors import APIError
+
+from dockerrotate.workers import imap_ordered
+
+
+def remove_all(objects, remove, args):
+    """
+    Call remove(object) for each object, yielding (object, error, duration) in input order.
+
+    error is the APIError raised while removing that object, or None on success; duration is
+    the time the removal took, in seconds. Nothing is removed when args.dry_run is set.
+    """
+    def _remove(obj):
+        if args.dry_run:
+            return obj, None, 0.0
+        with args.throttle.slot():
+            started = time.time()
+            try:
+                remove(obj)
+            except APIError as error:
+                return obj, error, time.time() - started
+            return obj, None, time.time() - started
+
+    return imap_ordered(_remove, objects, args.throttle.max_in_flight)
@@ -0,0 +1,111 @@
+"""
+A compact, columnar view of a list of tagged images, shared by the stages that decide which of
+them to remove ("keep" retention, images in use, and name/tag filters).
+
+Each image's repo tags are split into a normalized name and a tag once, when the snapshot is
+built, rather than in every stage. Names and tags are interned: each distinct name or tag is
+stored once, and images refer to them by number. Images are identified by their position in the
+list; creation times are kept in an array of integers, indexed by position, and the position of
+each image can be looked up by Id. Labels are indexed too, so that label policies can find the
+images with a label (value) without looking at every image.
+"""
+from array import array
+
+
+def normalize_tag_name(name_tag):
+    """
+    docker-py provides "RepoTags", which are strings of format "<image name>:<image tag>"
+
+    We want to strip off the tag part and normalize the name:
+
+       some.domain.com/organization/image:tag -> organization/image
+                       organization/image:tag -> organization/image
+                                    image:tag ->              image
+    """
+    return "/".join(name_tag.rsplit(":", 1)[0].split("/")[-2:])
+
+
+def tag_value(name_tag):
+    """
+    docker-py provides "RepoTags", which are strings of format "<image name>:<image tag>"
+
+    We want just the part after the colon.
+    """
+    return name_tag.rsplit(":", 1)[1]
+
+
+class ImageSnapshot(object):
+
+    __slots__ = ("images", "index", "created", "name_tags", "names", "tags", "labels")
+
+    def __init__(self, images):
+        # the images as listed, by position
+        self.images = list(images)
+        # position of each image, by Id
+        self.index = {}
+        # creation time of each image, in seconds since the epoch, by position
+        self.created = array("l")
+        # (name number, tag number) pairs of each image, without duplicates, by position
+        self.name_tags = []
+        # the distinct names and tags, by number
+        self.names = []
+        self.tags = []
+        # positions of the images with each label value, by label key and then value
+        self.labels = {}
+
+        # name number by repository (a repo tag without its tag), which recur across images
+        name_numbers_by_repository = {}
+        name_numbers, tag_numbers = {}, {}
+        index, created, tags, labels = self.index, self.created, self.tags, self.labels
+        for position, image in enumerate(self.images):
+            index[image["Id"]] = position
+            created.append(image["Created"])
+
+            pairs = []
+            for name_tag in image["RepoTags"]:
+                repository, _, tag = name_tag.rpartition(":")
+                name_number = name_numbers_by_repository.get(repository)
+                if name_number is None:
+                    name_number = _intern(normalize_tag_name(name_tag), name_numbers, self.names)
+                    name_numbers_by_repository[repository] = name_number
+                tag_number = tag_numbers.get(tag)
+                if tag_number is None:
+                    tag_number = tag_numbers[tag] = len(tags)
+                    tags.append(tag)
+                if (name_number, tag_number) not in pairs:
+                    pairs.append((name_number, tag_number))
+            self.name_tags.append(tuple(pairs))
+
+            for key, value in (image.get("Labels") or {}).iteritems():
+                labels.setdefault(key, {}).setdefault(value, []).append(position)
+
+    def __len__(self):
+        return len(self.images)
+
+    def positions(self, image_ids):
+        """
+        Return the positions of those of the given images that are in the snapshot.
+        """
+        index = self.index
+        return set(index[image_id] for image_id in image_ids if image_id in index)
+
+    def ids(self, positions):
+        return set(self.images[position]["Id"] for position in positions)
+
+    def label_values(self, key):
+        """
+        Return the value of a label for each image that has it, by position.
+        """
+        values = {}
+        for value, positions in self.labels.get(key, {}).iteritems():
+            for position in positions:
+                values[position] = value
+        return values
+
+
+def _intern(value, numbers, values):
+    number = numbers.get(value)
+    if number is None:
+        number = numbers[value] = len(values)
+        values.append(value)
+    return number
@@ -0,0 +1,199 @@
+"""
+A minimal native client for the Docker Engine API, selected with "--backend native".
+
+docker-py goes through requests, which costs a fair amount of CPU and memory per call and, for
+unix sockets, doesn't reuse connections well across threads. This client speaks HTTP/1.1 to the
+daemon directly with httplib, and keeps a pool of keep-alive connections shared by the worker
+threads, so each request costs one round trip on an already open connection.
+
+Only the calls docker-rotate makes are implemented, with the same names, arguments and results
+(including exceptions) as docker-py's Client. TLS isn't supported; use the default backend for
+daemons that need it.
+"""
+import calendar
+from datetime import datetime
+import httplib
+import json
+from Queue import LifoQueue, Empty
+import socket
+import urllib
+
+from docker.errors import APIError, NotFound
+from docker.utils import convert_filters
+
+from dockerrotate.client import DEFAULT_BASE_URL
+
+
+class _Response(object):
+    """
+    Just enough of a requests Response for docker-py's exceptions.
+    """
+
+    def __init__(self, status_code, reason, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.content = content
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        httplib.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def _check_status(method, path, response, body):
+    if response.status >= 400:
+        error_class = NotFound if response.status == 404 else APIError
+        raise error_class("{} {}".format(method, path),
+                          _Response(response.status, response.reason, body))
+
+
+def _flag(value):
+    return "1" if value else "0"
+
+
+class SocketClient(object):
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, version=None, timeout=None):
+        self.base_url = base_url
+        # None until known; see make_client
+        self.api_version = version
+        self.timeout = timeout
+        self._idle = LifoQueue()
+
+        scheme, _, address = base_url.partition("://")
+        if scheme == "unix":
+            path = "/" + address.lstrip("/")
+            self._new_connection = lambda timeout: UnixHTTPConnection(path, timeout=timeout)
+        elif scheme in ("tcp", "http"):
+            self._new_connection = lambda timeout: httplib.HTTPConnection(address, timeout=timeout)
+        else:
+            raise ValueError("Unsupported Docker host for the native backend: {}".format(base_url))
+
+    def _connect(self):
+        return self._new_connection(self.timeout)
+
+    def _path(self, path, params=None, versioned=True):
+        if versioned and self.api_version is not None:
+            path = "/v{}{}".format(self.api_version, path)
+        params = sorted((key, value) for key, value in (params or {}).items() if value is not None)
+        if params:
+            path = "{}?{}".format(path, urllib.urlencode(params))
+        return path
+
+    def _send(self, connection, method, path):
+        try:
+            connection.request(method, path)
+            return connection, connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+    def _request(self, method, path):
+        """
+        Make a request on a pooled connection, returning the (undecoded) response body.
+
+        A connection the daemon has closed while it was idle is replaced, and the request retried.
+        """
+        try:
+            connection = self._idle.get_nowait()
+        except Empty:
+            connection = None
+
+        try:
+            connection, response = self._send(connection or self._connect(), method, path)
+        except (httplib.BadStatusLine, socket.error) as error:
+            if connection is None or isinstance(error, socket.timeout):
+                raise
+            # the daemon closed the idle connection before it saw the request
+            connection, response = self._send(self._connect(), method, path)
+
+        try:
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._idle.put(connection)
+
+        _check_status(method, path, response, body)
+        return body
+
+    def _get_json(self, path, params=None, versioned=True):
+        return json.loads(self._request("GET", self._path(path, params, versioned)))
+
+    def version(self, api_version=True):
+        return self._get_json("/version", versioned=api_version)
+
+    def containers(self, all=False, filters=None):
+        return self._get_json("/containers/json", dict(
+            all=_flag(all),
+            filters=convert_filters(filters) if filters else None,
+        ))
+
+    def inspect_container(self, container):
+        return self._get_json("/containers/{}/json".format(urllib.quote(container)))
+
+    def remove_container(self, container, v=False, link=False, force=False):
+        self._request("DELETE", self._path("/containers/{}".format(urllib.quote(container)),
+                                           dict(v=_flag(v), link=_flag(link),
+                                                force=_flag(force))))
+
+    def images(self, all=False, filters=None):
+        return self._get_json("/images/json", dict(
+            all=_flag(all),
+            filters=convert_filters(filters) if filters else None,
+        ))
+
+    def inspect_image(self, image):
+        return self._get_json("/images/{}/json".format(urllib.quote(image, safe="/:@")))
+
+    def remove_image(self, image, force=False, noprune=False):
+        self._request("DELETE", self._path("/images/{}".format(urllib.quote(image, safe="/:@")),
+                                           dict(force=_flag(force), noprune=_flag(noprune))))
+
+    def prune_images(self, filters=None):
+        path = self._path("/images/prune", dict(
+            filters=convert_filters(filters) if filters else None))
+        return json.loads(self._request("POST", path))
+
+    def events(self, since=None, filters=None, decode=None):
+        """
+        Stream events from the daemon, as dicts if decode is set, otherwise as JSON strings.
+        """
+        if isinstance(since, datetime):
+            since = calendar.timegm(since.utctimetuple())
+        path = self._path("/events", dict(
+            since=since,
+            filters=convert_filters(filters) if filters else None,
+        ))
+
+        # the stream gets a connection of its own, which may be quiet for any length of time
+        connection, response = self._send(self._new_connection(None), "GET", path)
+        if response.status >= 400:
+            body = response.read()
+            connection.close()
+            _check_status("GET", path, response, body)
+
+        # events are few and far between; read them a byte at a time so none is held back
+        line = []
+        while True:
+            char = response.read(1)
+            if not char:
+                return
+            if char != "\n":
+                line.append(char)
+                continue
+            if line:
+                event = "".join(line)
+                yield json.loads(event) if decode else event
+            line = []
@@ -0,0 +1,125 @@
+"""
+Run statistics: Docker API calls counted and timed by endpoint, and time spent in each phase.
+
+Statistics are always collected (the overhead is negligible next to a daemon round trip); they
+are reported at exit with "--stats" and/or written in Prometheus text format for node_exporter's
+textfile collector with "--prometheus-textfile".
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.call_seconds = defaultdict(float)
+        self.phase_seconds = defaultdict(float)
+        self.phases = []
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def call(self, endpoint):
+        """
+        Count and time a call to a Docker API endpoint. Safe to use from worker threads.
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            with self._lock:
+                self.calls[endpoint] += 1
+                self.call_seconds[endpoint] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the run. Phases may nest; each is timed in full.
+        """
+        if name not in self.phase_seconds:
+            self.phases.append(name)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += time.time() - started
+
+    def count(self, name, value=1):
+        """
+        Add to a named counter.
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def merge(self, other):
+        """
+        Add another run's statistics to these.
+        """
+        with self._lock:
+            for endpoint, count in other.calls.items():
+                self.calls[endpoint] += count
+                self.call_seconds[endpoint] += other.call_seconds[endpoint]
+            for name in other.phases:
+                if name not in self.phase_seconds:
+                    self.phases.append(name)
+                self.phase_seconds[name] += other.phase_seconds[name]
+            for name, value in other.counters.items():
+                self.counters[name] += value
+
+    def write_prometheus_textfile(self, path):
+        """
+        Write the statistics in Prometheus text format, atomically replacing `path`.
+        """
+        lines = []
+
+        def gauge(name, help_text, label, values, value_format):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} gauge".format(name))
+            for key, value in values:
+                if label is None:
+                    lines.append(("{} " + value_format).format(name, value))
+                else:
+                    lines.append(('{}{{{}="{}"}} ' + value_format).format(name, label, key, value))
+
+        gauge("docker_rotate_last_run_timestamp_seconds", "When docker-rotate last ran.",
+              None, [(None, time.time())], "{:.3f}")
+        gauge("docker_rotate_api_calls", "Docker API calls made in the last run, by endpoint.",
+              "endpoint", sorted(self.calls.items()), "{}")
+        gauge("docker_rotate_api_call_seconds",
+              "Time spent in Docker API calls in the last run, by endpoint.",
+              "endpoint", sorted(self.call_seconds.items()), "{:.6f}")
+        gauge("docker_rotate_phase_seconds", "Time spent in each phase of the last run.",
+              "phase", [(name, self.phase_seconds[name]) for name in self.phases], "{:.6f}")
+        gauge("docker_rotate_counter", "Other counters from the last run.",
+              "name", sorted(self.counters.items()), "{}")
+
+        temporary_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary_path, "w") as textfile:
+            textfile.write("\n".join(lines) + "\n")
+        os.rename(temporary_path, path)
+
+
+class InstrumentedClient(object):
+    """
+    Wrap a docker-py client, counting and timing every public API call by method name.
+    """
+
+    def __init__(self, client, stats):
+        self._client = client
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        def _call(*args, **kwargs):
+            with self._stats.call(name):
+                return attribute(*args, **kwargs)
+
+        return _call
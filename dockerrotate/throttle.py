@@ -0,0 +1,94 @@
+"""
+Throttling of removals, to limit the load docker-rotate puts on a busy daemon.
+
+Removing an image or container is cheap for us but can be expensive for the daemon and its
+storage driver, and running workloads on the same host feel it. Removals can be limited to a
+rate ("--max-removals-per-second") and to a number in flight at once ("--max-in-flight").
+
+With "--slow-removal-threshold", we also back off when the daemon slows down: each removal that
+takes longer than the threshold halves the number of removals allowed in flight (and the rate, if
+limited), and delays the next removal by as long as the slow one took. Each removal that is
+faster than the threshold allows one more in flight, and a little more rate, up to the limits.
+"""
+from contextlib import contextmanager
+import threading
+import time
+
+
+# fraction of the configured rate recovered by each fast removal
+RATE_RECOVERY = 0.1
+
+# the rate is never reduced below this fraction of the configured rate
+MIN_RATE_FRACTION = 0.05
+
+
+class Throttle(object):
+
+    def __init__(self, rate=None, max_in_flight=1, latency_threshold=None, stats=None):
+        self.max_rate = rate
+        self.max_in_flight = max_in_flight
+        self.latency_threshold = latency_threshold
+        self.stats = stats
+
+        self.rate = rate
+        self.in_flight_limit = max_in_flight
+        self._in_flight = 0
+        self._next_start = 0.0
+        self._condition = threading.Condition()
+
+    def _wait_for_turn(self):
+        with self._condition:
+            while self._in_flight >= self.in_flight_limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+            now = time.time()
+            start = max(now, self._next_start)
+            if self.rate:
+                self._next_start = start + 1.0 / self.rate
+            else:
+                self._next_start = start
+
+        if start > now:
+            time.sleep(start - now)
+
+    def _adapt(self, latency):
+        if self.latency_threshold is None:
+            return
+
+        if latency > self.latency_threshold:
+            self.in_flight_limit = max(1, self.in_flight_limit // 2)
+            if self.rate:
+                self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self._next_start = max(self._next_start, time.time() + latency)
+            if self.stats is not None:
+                self.stats.count("removal_slowdowns")
+        else:
+            self.in_flight_limit = min(self.max_in_flight, self.in_flight_limit + 1)
+            if self.rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait until a removal may start, then time it and adapt to its latency.
+        """
+        self._wait_for_turn()
+        started = time.time()
+        try:
+            yield
+        finally:
+            latency = time.time() - started
+            with self._condition:
+                self._in_flight -= 1
+                self._adapt(latency)
+                self._condition.notify_all()
+
+
+def make_throttle(args):
+    return Throttle(
+        rate=args.max_removals_per_second,
+        max_in_flight=args.max_in_flight or args.concurrency,
+        latency_threshold=args.slow_removal_threshold,
+        stats=args.stats,
+    )
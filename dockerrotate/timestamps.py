@@ -0,0 +1,36 @@
+"""
+Parsing of the timestamps found in Docker inspection data.
+
+The daemon formats times as RFC 3339 in UTC with up to nanosecond precision (e.g.
+"2016-08-03T17:29:53.474346591Z"), and uses "0001-01-01T00:00:00Z" for times that haven't
+happened yet. dateutil's general purpose parser is slow for this; we match the format directly,
+and only fall back to dateutil for anything else.
+"""
+from datetime import datetime
+import re
+
+from dateutil.tz import tzutc
+
+
+UTC = tzutc()
+
+TIMESTAMP_REGEX = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,9}))?Z\Z')
+
+
+def parse_timestamp(value):
+    """
+    Parse a Docker timestamp into a timezone-aware datetime.
+
+    Fractions of a second beyond microseconds are truncated.
+    """
+    match = TIMESTAMP_REGEX.match(value)
+    if match is None:
+        # rarely needed, and slow to import
+        from dateutil import parser
+
+        return parser.parse(value)
+
+    year, month, day, hour, minute, second, fraction = match.groups()
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                    int(fraction[:6].ljust(6, "0")) if fraction else 0, UTC)
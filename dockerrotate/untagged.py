@@ -7,32 +7,142 @@ cleanup with command line utilities alone, using something like:
 ... it also makes sense to consolidate cleanup in a single tool. (I note that, in the case
 where an untagged image is in use, the above will generate an error message, whereas the code
 here is smart enough not to try to delete images that are in use.)
+
+On engines that support it (API 1.25+), removal can instead be delegated to the daemon's image
+prune endpoint, which removes all unused dangling images in a single request. The daemon performs
+the same in-use check we do.
 """
-from docker.errors import APIError
+from datetime import datetime
+import sys
+import time
+
+from dateutil.tz import tzutc
+from docker.utils import convert_filters
 
+from dockerrotate.compat import api_version_at_least
 from dockerrotate.containers import all_containers
+from dockerrotate.removal import remove_all
+
+
+PRUNE_API_VERSION = "1.25"
+
+# the "until" filter for image prune was added later than the endpoint itself
+PRUNE_UNTIL_API_VERSION = "1.28"
 
 
 def _find_image_ids_in_use(containers):
     return set(container["ImageID"] for container in containers)
 
 
-def clean_untagged(args):
-    containers = all_containers(args)
-    untagged_images = args.client.images(filters=dict(dangling=True))
+def is_dangling(image):
+    """
+    Return True if the image would be listed by the daemon's "dangling=true" filter.
+    """
+    tags = [tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>"]
+    digests = [digest for digest in image.get("RepoDigests") or [] if digest != "<none>@<none>"]
+    return not tags and not digests
+
+
+def determine_untagged_images_to_remove(untagged_images, containers, args):
     image_ids_in_use = _find_image_ids_in_use(containers)
 
-    for image in untagged_images:
-        if image["Id"] in image_ids_in_use:
-            continue
+    def old_enough(image):
+        if args.min_age is None:
+            return True
+        created_at = datetime.fromtimestamp(image["Created"], tzutc())
+        return (args.now - created_at) >= args.min_age
+
+    return [image for image in untagged_images
+            if image["Id"] not in image_ids_in_use and old_enough(image)]
+
+
+def remove_untagged_images(images, args):
+    """
+    Remove the given untagged images, returning those that were removed (or would be, in a dry
+    run).
+    """
+    def _remove(image):
+        args.client.remove_image(image["Id"], noprune=False)
+
+    if args.plan is not None:
+        args.plan.record_untagged_images(images)
+
+    started = time.time()
+    removed, reclaimed = [], 0
+    with args.stats.phase("remove_untagged_images"):
+        for image, error, duration in remove_all(images, _remove, args):
+            args.reporter.untagged_image(image, "dangling", error, duration)
+            if error is None:
+                removed.append(image)
+                reclaimed += image.get("Size", 0)
 
-        print "Removing untagged image with Id: {}".format(image["Id"])
+    if not args.dry_run:
+        args.reporter.reclaimed("untagged-image", len(removed), reclaimed,
+                                time.time() - started)
+    return removed
 
-        if args.dry_run:
-            continue
 
-        try:
-            args.client.remove_image(image["Id"], noprune=False)
-        except APIError as error:
-            print "unexpected: API error while trying to delete untagged image. Error message is:"
-            print error.message
+def can_prune(args):
+    """
+    Return True if untagged image removal can be delegated to the daemon's prune endpoint.
+    """
+    if args.dry_run:
+        # the daemon can't tell us what it would prune
+        return False
+    if args.min_age is not None:
+        return api_version_at_least(args, PRUNE_UNTIL_API_VERSION)
+    return api_version_at_least(args, PRUNE_API_VERSION)
+
+
+def _cannot_prune_reason(args):
+    if args.dry_run:
+        return "this is a dry run"
+    minimum = PRUNE_UNTIL_API_VERSION if args.min_age is not None else PRUNE_API_VERSION
+    # docker-py 1.x speaks API 1.24 unless told otherwise
+    return "it needs API {}+, but requests are made at API {} (see \"--client-version\")".format(
+        minimum, args.api_version)
+
+
+def prune_untagged_images(args):
+    """
+    Remove unused dangling images with a single request to the daemon's prune endpoint.
+    """
+    filters = dict(dangling=True)
+    if args.min_age is not None:
+        filters["until"] = "{}s".format(int(args.min_age.total_seconds()))
+
+    started = time.time()
+    with args.stats.phase("prune_untagged_images"):
+        if hasattr(args.client, "prune_images"):
+            result = args.client.prune_images(filters=filters)
+        else:
+            # docker-py doesn't wrap this endpoint (before docker 2.x), so call it directly.
+            with args.stats.call("prune_images"):
+                response = args.client._post(args.client._url("/images/prune"),
+                                             params=dict(filters=convert_filters(filters)))
+                result = args.client._result(response, True)
+    duration = time.time() - started
+
+    deleted = [entry["Deleted"] for entry in result.get("ImagesDeleted") or []
+               if "Deleted" in entry]
+    for image_id in deleted:
+        args.reporter.untagged_image(dict(Id=image_id), "dangling", None, None)
+
+    args.reporter.reclaimed("untagged-image", len(deleted), result.get("SpaceReclaimed", 0),
+                            duration)
+
+
+def clean_untagged(args):
+    if args.prune:
+        if can_prune(args):
+            prune_untagged_images(args)
+            return
+        print >> sys.stderr, "Not pruning: {}; removing untagged images one by one".format(
+            _cannot_prune_reason(args))
+
+    containers = all_containers(args)
+    with args.stats.phase("list_images"):
+        untagged_images = args.client.images(filters=dict(dangling=True))
+
+    remove_untagged_images(
+        determine_untagged_images_to_remove(untagged_images, containers, args), args)
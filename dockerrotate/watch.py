@@ -0,0 +1,251 @@
+"""
+Code for the long-running "watch" mode, which cleans up as the daemon's state changes.
+
+Rather than re-listing everything on every run, we take one full snapshot of containers and
+images, then follow the Docker events stream to keep that snapshot up to date:
+
+ - when a container is created or stops, we work out when it will become eligible for removal
+   under the container policies, and check it again at exactly that time
+ - when a container is destroyed, or an image is pulled, tagged, untagged or deleted, the
+   "keep" retention is re-evaluated, but only for the image names affected
+
+Container state is only ever updated from events, so in dry-run mode containers we would have
+removed still count as using their images.
+"""
+import calendar
+from datetime import datetime
+import heapq
+from Queue import Queue, Empty
+import threading
+
+from dateutil.tz import tzutc
+from docker.errors import NotFound
+
+from dockerrotate.compat import api_version_at_least
+from dockerrotate.containers import all_containers, candidate_containers, inspect_container, \
+    forget_inspection, inspect_containers, include_container, removal_due, remove_containers
+from dockerrotate.graph import ImageGraph
+from dockerrotate.images import determine_images_to_remove, plan_image_removal, remove_images
+from dockerrotate.snapshot import normalize_tag_name
+from dockerrotate.timestamps import parse_timestamp
+from dockerrotate.untagged import is_dangling
+
+
+# Longest time to block waiting for events; keeps the process responsive to interrupts.
+MAX_WAIT_SECONDS = 60
+
+
+def _event_type_and_action(event):
+    # API 1.22+ reports Type and Action; older engines only report container events with "from"
+    event_type = event.get("Type") or ("container" if "from" in event else "image")
+    return event_type, event.get("Action") or event.get("status")
+
+
+def _image_entry(inspect_data):
+    """
+    Convert image inspection data to the format of an entry in the image list.
+    """
+    created = parse_timestamp(inspect_data["Created"])
+    return dict(
+        Id=inspect_data["Id"],
+        ParentId=inspect_data.get("Parent", ""),
+        RepoTags=inspect_data.get("RepoTags") or [],
+        RepoDigests=inspect_data.get("RepoDigests") or [],
+        Created=int((created - datetime(1970, 1, 1, tzinfo=tzutc())).total_seconds()),
+        Size=inspect_data.get("Size", 0),
+        VirtualSize=inspect_data.get("VirtualSize", inspect_data.get("Size", 0)),
+        Labels=(inspect_data.get("Config") or {}).get("Labels") or {},
+    )
+
+
+def _image_names(image):
+    return set(normalize_tag_name(name_tag) for name_tag in image.get("RepoTags") or [])
+
+
+class Watcher(object):
+
+    def __init__(self, args):
+        self.args = args
+        # list data, by Id
+        self.containers = {}
+        self.images = {}
+        # heap of (due time, container Id)
+        self.due = []
+        self.events = Queue()
+        self.touched_names = set()
+
+    def snapshot(self):
+        """
+        Load the full state of the daemon, and start following events from this point on.
+        """
+        # as seconds since the epoch: docker-py 1.x can't convert timezone-aware datetimes
+        since = calendar.timegm(datetime.now(tzutc()).utctimetuple())
+        self.containers = dict((container["Id"], container)
+                               for container in all_containers(self.args))
+        with self.args.stats.phase("list_images"):
+            self.images = dict((image["Id"], image)
+                               for image in self.args.client.images(all=False))
+
+        reader = threading.Thread(target=self._read_events, args=(since,))
+        reader.daemon = True
+        reader.start()
+
+        for container, inspect_data in inspect_containers(
+                candidate_containers(self.args, self.containers.values()), self.args):
+            self._schedule(container["Id"], inspect_data)
+
+        for image in self.images.values():
+            self.touched_names.update(_image_names(image))
+
+    def _read_events(self, since):
+        filters = None
+        if api_version_at_least(self.args, "1.22"):
+            filters = dict(type=["container", "image"])
+        try:
+            for event in self.args.client.events(since=since, filters=filters, decode=True):
+                self.events.put(event)
+            self.events.put(EOFError("The Docker event stream ended"))
+        except Exception as error:
+            self.events.put(error)
+
+    def _schedule(self, container_id, inspect_data):
+        due = removal_due(inspect_data, self.args)
+        if due is not None:
+            heapq.heappush(self.due, (due, container_id))
+
+    def handle(self, event):
+        """
+        Update our state from a Docker event.
+        """
+        event_type, action = _event_type_and_action(event)
+        object_id = event.get("id")
+        if not object_id:
+            return
+
+        if event_type == "container":
+            self._handle_container(object_id, action)
+        elif event_type == "image":
+            self._handle_image(object_id, action)
+
+    def _handle_container(self, container_id, action):
+        # anything might have changed; don't use cached inspection data
+        forget_inspection(container_id, self.args)
+
+        if action != "destroy":
+            try:
+                inspect_data = inspect_container(dict(Id=container_id), self.args)
+            except NotFound:
+                action = "destroy"
+            else:
+                self.containers[container_id] = dict(
+                    Id=container_id,
+                    Image=(inspect_data.get("Config") or {}).get("Image", inspect_data["Image"]),
+                    ImageID=inspect_data["Image"],
+                    Names=[inspect_data.get("Name", "")],
+                )
+                self._schedule(container_id, inspect_data)
+                return
+
+        container = self.containers.pop(container_id, None)
+        if container is not None and container["ImageID"] in self.images:
+            # the image might no longer be in use
+            self.touched_names.update(_image_names(self.images[container["ImageID"]]))
+
+    def _handle_image(self, image_id, action):
+        old_image = self.images.get(image_id)
+        if action == "delete":
+            self.images.pop(image_id, None)
+        else:
+            try:
+                image = _image_entry(self.args.client.inspect_image(image_id))
+            except NotFound:
+                self.images.pop(image_id, None)
+            else:
+                # for e.g. "pull" events, the event's id is the image reference, not its Id
+                old_image = old_image or self.images.get(image["Id"])
+                self.images[image["Id"]] = image
+                self.touched_names.update(_image_names(image))
+
+        if old_image is not None:
+            self.touched_names.update(_image_names(old_image))
+
+    def remove_due_containers(self):
+        """
+        Remove containers whose time has come.
+        """
+        self.args.now = datetime.now(tzutc())
+        due_ids = []
+        while self.due and self.due[0][0] <= self.args.now:
+            _, container_id = heapq.heappop(self.due)
+            if container_id not in due_ids:
+                due_ids.append(container_id)
+        if not due_ids:
+            return
+
+        # the container may have changed state since it was scheduled; check again
+        for container_id in due_ids:
+            forget_inspection(container_id, self.args)
+        containers = [self.containers.get(container_id) or dict(Id=container_id)
+                      for container_id in due_ids]
+        to_remove = [container for container, inspect_data
+                     in inspect_containers(containers, self.args)
+                     if include_container(container, self.args, inspect_data)]
+        for container in to_remove:
+            container.setdefault("Image", self.args.inspections[container["Id"]]["Image"])
+        remove_containers(to_remove, self.args)
+
+    def rotate_images(self):
+        """
+        Re-evaluate image retention for the image names affected since the last evaluation.
+        """
+        names, self.touched_names = self.touched_names, set()
+        if self.args.keep is None or not names:
+            return
+
+        # images of other names may share a "--keep-by-label" group; consider them all
+        images = [image for image in self.images.values()
+                  if image.get("RepoTags") and not is_dangling(image) and
+                  (self.args.keep_by_label or _image_names(image) & names)]
+        # only top-level images are tracked, so parent/child links between them are all we know
+        graph = ImageGraph(self.images.values())
+        containers = self.containers.values()
+        images_to_remove = determine_images_to_remove(images, containers, self.args)
+        remove_images(plan_image_removal(images_to_remove, graph, containers, self.args),
+                      self.args)
+
+    def _next_event(self):
+        """
+        Wait for the next event, but no longer than until the next container is due.
+        """
+        timeout = MAX_WAIT_SECONDS
+        if self.due:
+            until_due = (self.due[0][0] - datetime.now(tzutc())).total_seconds()
+            timeout = max(0, min(timeout, until_due))
+        try:
+            return self.events.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def run(self):
+        self.snapshot()
+        while True:
+            self.remove_due_containers()
+            self.rotate_images()
+            self.args.reporter.flush()
+
+            event = self._next_event()
+            while event is not None:
+                if isinstance(event, Exception):
+                    raise SystemExit("Lost the Docker event stream: {}".format(event))
+                self.handle(event)
+                try:
+                    event = self.events.get_nowait()
+                except Empty:
+                    event = None
+
+
+def watch(args):
+    """
+    Main entry point - clean up continuously, driven by Docker events.
+    """
+    Watcher(args).run()
@@ -0,0 +1,59 @@
+"""
+Helpers for spreading blocking Docker API calls over a bounded pool of worker threads.
+
+docker-py's client is synchronous, so the only way to keep more than one request in flight against
+the daemon is to issue requests from several threads. Results are always handed back in input
+order, so callers (and their output) behave exactly as they would in a serial loop.
+"""
+from collections import deque
+import sys
+import threading
+
+
+def imap_ordered(func, items, concurrency):
+    """
+    Apply func to every item using at most `concurrency` threads, yielding results in input order.
+
+    Exceptions raised by func propagate to the caller when the corresponding result is reached.
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    tasks = deque(enumerate(items))
+    results = {}
+    finished = threading.Condition()
+
+    def _work():
+        while True:
+            try:
+                index, item = tasks.popleft()
+            except IndexError:
+                return
+            try:
+                outcome = (True, func(item))
+            except BaseException:
+                outcome = (False, sys.exc_info())
+            with finished:
+                results[index] = outcome
+                finished.notify_all()
+
+    for _ in range(min(concurrency, len(items))):
+        worker = threading.Thread(target=_work)
+        worker.daemon = True
+        worker.start()
+
+    try:
+        for index in range(len(items)):
+            with finished:
+                while index not in results:
+                    finished.wait()
+                succeeded, value = results.pop(index)
+            if not succeeded:
+                raise value[0], value[1], value[2]
+            yield value
+    finally:
+        # if we stopped early, don't let the workers start on anything else
+        tasks.clear()
@@ -1,5 +1,7 @@
 from datetime import timedelta
 
+import pytest
+
 from dockerrotate.main import parse_arguments
 
 
@@ -10,3 +12,42 @@ def test_timestamp_parsing():
     assert parse_arguments(['containers', '--created', '2d']).created == timedelta(days=2)
     assert parse_arguments(['containers', '--created', '0h']).created == timedelta()
     assert parse_arguments(['containers', '--created', '0']).created == timedelta()
+
+
+def test_size_parsing():
+
+    assert parse_arguments(['images', '--keep', '1', '--target-free', '100']).target_free == 100
+    assert parse_arguments(['images', '--keep', '1', '--target-free', '2k']).target_free == 2048
+    assert parse_arguments(['images', '--keep', '1', '--target-free', '3MB']).target_free == \
+        3 * 1024 ** 2
+    assert parse_arguments(['images', '--keep', '1', '--target-free', '1G']).target_free == \
+        1024 ** 3
+
+
+def test_subcommand_functions():
+
+    args = parse_arguments(['plan', 'plan.json', 'images', '--keep', '1'])
+    assert (args.func.__module__, args.func.__name__) == ("dockerrotate.plan", "write_plan")
+    assert (args.plan_func.__module__, args.plan_func.__name__) == \
+        ("dockerrotate.images", "clean_images")
+    assert args.single_host
+
+
+def test_age_arguments():
+
+    args = parse_arguments(['all', '--keep', '1', '--min-age', '1h', '--max-age', '2d'])
+    assert (args.min_age, args.max_age) == (timedelta(hours=1), timedelta(days=2))
+    assert parse_arguments(['untagged-images', '--min-age', '1h']).min_age == timedelta(hours=1)
+
+
+def test_positive_numbers():
+
+    assert parse_arguments(['--concurrency', '2', 'containers']).concurrency == 2
+    assert parse_arguments(['--max-removals-per-second', '0.5', 'containers']) \
+        .max_removals_per_second == 0.5
+    for option, value in (('--concurrency', '0'), ('--max-in-flight', '-1'),
+                          ('--host-concurrency', 'x'), ('--max-removals-per-second', '0'),
+                          ('--max-removals-per-second', 'nan'),
+                          ('--slow-removal-threshold', '0'), ('--slow-removal-threshold', '-2')):
+        with pytest.raises(SystemExit):
+            parse_arguments([option, value, 'containers'])
@@ -0,0 +1,144 @@
+import sqlite3
+
+from docker import Client
+from mock import create_autospec
+
+from dockerrotate.cache import EPOCH, InspectionCache, _agrees, open_inspection_cache
+from dockerrotate.containers import determine_containers_to_remove
+from dockerrotate.main import parse_arguments
+from utils import created_container_entry, exited_container_entry, dead_container_entry, \
+                  running_container_entry, mins_ago, containers_result, containers_list_result
+
+
+IID = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
+
+CID1 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc01"
+CID2 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc02"
+CID3 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc03"
+CID4 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc04"
+
+
+def _run(containers, path, arg_values, api_version=None):
+    """
+    Determine containers to remove as a separate run would, with its own cache and client.
+    """
+    args = parse_arguments(arg_values)
+    args.client = create_autospec(Client)
+    args.api_version = api_version
+    if api_version is None:
+        args.client.containers.return_value = containers_result(containers)
+    else:
+        args.client.containers.side_effect = \
+            lambda all=False, filters=None: containers_list_result(containers, filters)
+    lookup = {container["Id"]: container for container in containers}
+    args.client.inspect_container.side_effect = lambda container_id: lookup[container_id]
+    args.inspect_cache = InspectionCache(path, "unix://var/run/docker.sock")
+
+    result = determine_containers_to_remove(args)
+    args.inspect_cache.save()
+
+    inspected = [call[0][0] for call in args.client.inspect_container.call_args_list]
+    return sorted(container["Id"] for container in result), sorted(inspected)
+
+
+def _cached_ids(path):
+    connection = sqlite3.connect(path)
+    try:
+        return sorted(row[0] for row in connection.execute("SELECT id FROM containers"))
+    finally:
+        connection.close()
+
+
+def test_only_new_containers_are_inspected(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    arg_values = ['containers', '--exited', '1h', '--created', '1h', '--dead', '1h']
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(120)),
+        created_container_entry(CID2, IID, mins_ago(30)),
+        dead_container_entry(CID3, IID, mins_ago(120)),
+        running_container_entry(CID4, IID, mins_ago(120)),
+    ]
+
+    assert _run(containers, path, arg_values) == ([CID1, CID3], [CID1, CID2, CID3, CID4])
+    assert _cached_ids(path) == [CID1, CID2, CID3]
+
+    # same decisions, but only the running container needs inspecting
+    assert _run(containers, path, arg_values) == ([CID1, CID3], [CID4])
+
+
+def test_vanished_containers_are_dropped(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    arg_values = ['containers', '--exited', '1h']
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(120)),
+        exited_container_entry(CID2, IID, mins_ago(30)),
+    ]
+    _run(containers, path, arg_values)
+    assert _cached_ids(path) == [CID1, CID2]
+
+    _run(containers[1:], path, arg_values)
+    assert _cached_ids(path) == [CID2]
+
+
+def test_restarted_container_is_inspected_again(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    arg_values = ['containers', '--exited', '1h', '--created', '1h']
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(120)),
+        created_container_entry(CID2, IID, mins_ago(120)),
+    ]
+    assert _run(containers, path, arg_values, "1.24") == ([CID1, CID2], [CID1, CID2])
+
+    # the created container has since been started and has stopped again
+    containers[1] = exited_container_entry(CID2, IID, mins_ago(5))
+    assert _run(containers, path, arg_values, "1.24") == ([CID1], [CID2])
+
+
+def test_caches_are_per_daemon(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    cache = InspectionCache(path, "tcp://one:2376")
+    container = exited_container_entry(CID1, IID, mins_ago(120))
+    cache.put(container)
+    cache.save()
+
+    listed = containers_result([container])[0]
+    assert InspectionCache(path, "tcp://two:2376").get(listed, mins_ago(0)) is None
+    inspect_data = InspectionCache(path, "tcp://one:2376").get(listed, mins_ago(0))
+    assert inspect_data["State"]["Status"] == "exited"
+    assert abs((inspect_data["State"]["FinishedAt"] - mins_ago(120)).total_seconds()) < 0.001
+
+
+def test_restarted_and_exited_again(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    arg_values = ['containers', '--exited', '1d']
+
+    containers = [exited_container_entry(CID1, IID, mins_ago(3 * 24 * 60))]
+    assert _run(containers, path, ['--dry-run'] + arg_values) == ([CID1], [CID1])
+
+    # restarted, and exited again a few minutes ago, all between two runs
+    containers = [exited_container_entry(CID1, IID, mins_ago(5))]
+    assert _run(containers, path, arg_values) == ([], [CID1])
+
+
+def test_exited_status_text():
+    now = mins_ago(0)
+    finished_at = (mins_ago(3 * 24 * 60) - EPOCH).total_seconds()
+    for status_text, agrees in [("Exited (0) 3 days ago", True),
+                                ("Exited (137) 4 days ago", True),
+                                ("Exited (0) 2 days ago", True),
+                                ("Exited (0) 47 hours ago", False),
+                                ("Exited (0) About an hour ago", False),
+                                ("Exited (0) Less than a second ago", False),
+                                ("Exited (0) just now", False),
+                                ("Up 3 days", False)]:
+        container = dict(Id=CID1, Status=status_text)
+        assert _agrees(container, "exited", finished_at, now) == agrees, status_text
+
+
+def test_open_is_keyed_on_the_configured_daemon(tmpdir):
+    args = parse_arguments(['--inspect-cache', str(tmpdir.join("cache.db")), 'containers'])
+    # docker-py's base_url is the same for every unix socket
+    args.client = create_autospec(Client)
+    args.client.base_url = "http+docker://localunixsocket"
+    args.daemon = "unix:///run/docker.sock"
+    assert open_inspection_cache(args).daemon == "unix:///run/docker.sock"
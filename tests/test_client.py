@@ -0,0 +1,50 @@
+import json
+
+from docker import Client
+from mock import create_autospec, patch
+
+from dockerrotate.client import make_client
+from dockerrotate.main import parse_arguments
+
+
+def _make_client(arg_values):
+    args = parse_arguments(arg_values + ['containers'])
+    client = create_autospec(Client)
+    client.api_version = "1.24"
+    client.version.return_value = dict(ApiVersion="1.23")
+    with patch("docker.Client", return_value=client):
+        make_client(args, dict(DOCKER_HOST="unix:///run/docker.sock"))
+    return args, client
+
+
+def test_version_without_cache():
+    args, client = _make_client([])
+    assert client.version.call_count == 1
+    assert args.api_version == "1.23"
+    assert args.daemon == "unix:///run/docker.sock"
+
+
+def test_version_cache(tmpdir):
+    path = str(tmpdir.join("versions.json"))
+
+    args, client = _make_client(['--version-cache', path])
+    assert client.version.call_count == 1
+    assert json.load(open(path))["unix:///run/docker.sock"]["ApiVersion"] == "1.23"
+
+    args, client = _make_client(['--version-cache', path])
+    assert client.version.call_count == 0
+    assert args.stats.counters["version_cache_hits"] == 1
+    assert args.api_version == "1.23"
+
+    # expired
+    args, client = _make_client(['--version-cache', path, '--version-cache-ttl', '0s'])
+    assert client.version.call_count == 1
+
+
+def test_corrupt_version_cache(tmpdir):
+    path = tmpdir.join("versions.json")
+    path.write("{")
+
+    args, client = _make_client(['--version-cache', str(path)])
+    assert client.version.call_count == 1
+    assert args.api_version == "1.23"
@@ -0,0 +1,54 @@
+from docker import Client
+from mock import create_autospec
+
+from dockerrotate.main import parse_arguments
+from utils import image_entry, exited_container_entry, running_container_entry, mins_ago, \
+                  containers_result
+
+
+IID1 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
+IID2 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb02"
+IID3 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb03"
+IID4 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb04"
+
+CID1 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc01"
+CID2 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc02"
+CID3 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc03"
+
+
+def _mock_client(images, containers):
+    mock_client = create_autospec(Client)
+    mock_client.images.return_value = images
+    mock_client.containers.return_value = containers_result(containers)
+    lookup = {container["Id"]: container for container in containers}
+    mock_client.inspect_container.side_effect = lambda container_id: lookup[container_id]
+    return mock_client
+
+
+def test_single_snapshot():
+    images = [
+        image_entry(IID1, mins_ago(200), "foo:v1.1"),
+        image_entry(IID2, mins_ago(190), "foo:v1.2"),
+        image_entry(IID3, mins_ago(180), "foo:v1.3"),
+        image_entry(IID4, mins_ago(300), "<none>:<none>"),
+    ]
+    containers = [
+        # removing this container frees up IID1 and IID4
+        exited_container_entry(CID1, IID1, mins_ago(120)),
+        exited_container_entry(CID2, IID4, mins_ago(120)),
+        # ... but this one is still running
+        running_container_entry(CID3, IID2, mins_ago(120)),
+    ]
+    args = parse_arguments(['all', '--exited', '1h', '--keep', '1'])
+    args.client = _mock_client(images, containers)
+
+    args.func(args)
+
+    assert args.client.images.call_count == 1
+    assert args.client.containers.call_count == 1
+
+    removed_containers = [call[0][0] for call in args.client.remove_container.call_args_list]
+    assert removed_containers == [CID1, CID2]
+
+    removed_images = [call[0][0] for call in args.client.remove_image.call_args_list]
+    assert removed_images == [IID4, IID1]
@@ -1,11 +1,12 @@
 from docker import Client
+from docker.errors import NotFound
 from mock import create_autospec
 
-from dockerrotate.containers import determine_containers_to_remove
+from dockerrotate.containers import all_containers, determine_containers_to_remove
 from dockerrotate.main import parse_arguments
 from utils import created_container_entry, exited_container_entry, \
                   dead_container_entry, running_container_entry, mins_ago, \
-                  containers_result
+                  containers_result, containers_list_result, api_error
 
 
 IID = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
@@ -92,3 +93,85 @@ def test_dead():
     _mock_containers(containers, args)
     result = determine_containers_to_remove(args)
     _assert_ids(result, CID1, CID2)
+
+
+def test_vanished_container():
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(2465)),
+        exited_container_entry(CID2, IID, mins_ago(2465)),
+        exited_container_entry(CID3, IID, mins_ago(2465)),
+    ]
+    args = parse_arguments(['containers', '--exited', '1h'])
+    _mock_containers(containers, args)
+    lookup = {container["Id"]: container for container in containers}
+
+    def inspect_container(container_id):
+        if container_id == CID2:
+            raise api_error(NotFound, 404, "No such container: {}".format(container_id))
+        return lookup[container_id]
+
+    args.client.inspect_container.side_effect = inspect_container
+    result = determine_containers_to_remove(args)
+    _assert_ids(result, CID1, CID3)
+
+
+def test_serial_inspection():
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(2465)),
+        exited_container_entry(CID2, IID, mins_ago(25)),
+        created_container_entry(CID3, IID, mins_ago(2001)),
+        running_container_entry(CID4, IID, mins_ago(2465)),
+    ]
+    args = parse_arguments(['--concurrency', '1',
+                            'containers', '--exited', '1h', '--created', '1d'])
+    _mock_containers(containers, args)
+    result = determine_containers_to_remove(args)
+    assert [container["Id"] for container in result] == [CID1, CID3]
+
+
+def test_list_state_fast_path():
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(2465)),
+        exited_container_entry(CID2, IID, mins_ago(25)),
+        running_container_entry(CID3, IID, mins_ago(2465)),
+        created_container_entry(CID4, IID, mins_ago(2001)),
+        dead_container_entry(CID5, IID, mins_ago(2011)),
+    ]
+    args = parse_arguments(['containers', '--exited', '1h', '--dead', '1h'])
+    _mock_containers(containers, args)
+    args.api_version = "1.24"
+    args.client.containers.side_effect = \
+        lambda all=False, filters=None: containers_list_result(containers, filters)
+
+    result = determine_containers_to_remove(args)
+    _assert_ids(result, CID1, CID5)
+
+    args.client.containers.assert_called_once_with(
+        all=True, filters=dict(status=["exited", "dead"]))
+    inspected = set(call[0][0] for call in args.client.inspect_container.call_args_list)
+    assert inspected == set([CID1, CID2, CID5])
+
+
+def test_no_policy():
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(2465)),
+    ]
+    args = parse_arguments(['containers'])
+    _mock_containers(containers, args)
+    assert determine_containers_to_remove(args) == []
+    assert not args.client.inspect_container.called
+
+
+def test_legacy_image_id_backfill_is_cached():
+    containers = [
+        exited_container_entry(CID1, IID, mins_ago(2465)),
+        running_container_entry(CID2, IID, mins_ago(2465)),
+    ]
+    args = parse_arguments(['containers', '--exited', '1h'])
+    _mock_containers(containers, args)
+    # pre-1.21 API: no ImageID in the container list
+    args.client.containers.return_value = [dict(Id=container["Id"]) for container in containers]
+
+    assert [container["ImageID"] for container in all_containers(args)] == [IID, IID]
+    _assert_ids(determine_containers_to_remove(args), CID1)
+    assert args.client.inspect_container.call_count == 2
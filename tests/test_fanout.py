@@ -0,0 +1,74 @@
+from StringIO import StringIO
+
+from argparse import ArgumentTypeError
+from docker import Client
+from mock import create_autospec, patch
+import pytest
+from requests.exceptions import ConnectionError
+
+from dockerrotate.fanout import HostSpec, host_spec_type, read_hosts_file, run_on_hosts
+from dockerrotate.main import main, parse_arguments
+from utils import image_entry, mins_ago
+
+
+def test_host_spec():
+    assert host_spec_type("unix://var/run/docker.sock") == \
+        HostSpec("unix://var/run/docker.sock", {"DOCKER_HOST": "unix://var/run/docker.sock"})
+    assert host_spec_type("tcp://a:2376 tls_verify=1 cert_path=/certs/a") == \
+        HostSpec("tcp://a:2376", {"DOCKER_HOST": "tcp://a:2376",
+                                  "DOCKER_TLS_VERIFY": "1",
+                                  "DOCKER_CERT_PATH": "/certs/a"})
+    assert host_spec_type("tcp://a:2375 tls_verify=0") == \
+        HostSpec("tcp://a:2375", {"DOCKER_HOST": "tcp://a:2375"})
+
+    with pytest.raises(ArgumentTypeError):
+        host_spec_type("tcp://a:2376 verify=1")
+
+
+def test_hosts_file(tmpdir):
+    path = tmpdir.join("hosts")
+    path.write("# build hosts\ntcp://a:2376 tls_verify=1\n\ntcp://b:2376  # flaky\n")
+    assert [host.url for host in read_hosts_file(str(path))] == ["tcp://a:2376", "tcp://b:2376"]
+
+    path.write("tcp://a:2376\n\ntcp://b:2376 verify=1\n")
+    with pytest.raises(SystemExit) as error:
+        read_hosts_file(str(path))
+    assert str(error.value) == \
+        "Invalid hosts file {}, line 3: Invalid host option 'verify=1'".format(path)
+
+
+def _fake_make_client(args, environment):
+    if environment["DOCKER_HOST"] == "tcp://down:2376":
+        raise ConnectionError("connection refused")
+    client = create_autospec(Client)
+    client.images.return_value = [image_entry("i1", mins_ago(10), "<none>:<none>")]
+    client.containers.return_value = []
+    return client
+
+
+def test_run_on_hosts():
+    args = parse_arguments(['--host', 'tcp://a:2376', '--host', 'tcp://down:2376',
+                            '--host', 'tcp://b:2376', 'untagged-images'])
+    args.reporter.stream = StringIO()
+
+    with patch("dockerrotate.fanout.make_client", _fake_make_client):
+        with pytest.raises(SystemExit) as error:
+            run_on_hosts(args)
+
+    assert str(error.value) == "1 of 3 hosts failed"
+    lines = args.reporter.stream.getvalue().splitlines()
+    assert lines[0] == "[tcp://a:2376] Removing untagged image with Id: i1"
+    assert lines[2] == "[tcp://b:2376] Removing untagged image with Id: i1"
+    assert lines[4].startswith("Host tcp://a:2376: succeeded")
+    assert lines[5].startswith("Host tcp://down:2376: failed")
+    assert lines[5].endswith(": connection refused")
+
+
+def test_single_host_subcommands():
+    for arg_values in (['watch', '--exited', '1h'],
+                       ['plan', 'plan.json', 'containers', '--exited', '1h'],
+                       ['apply', 'plan.json']):
+        with pytest.raises(SystemExit) as error:
+            main(['--host', 'tcp://a:2376'] + arg_values)
+        assert str(error.value) == \
+            "\"{}\" can only be run against a single Docker daemon".format(arg_values[0])
@@ -0,0 +1,67 @@
+from dockerrotate.filter import ImageFilter
+
+
+def _matches(image_filter, name_tags):
+    """
+    Match (name, tag) pairs through matcher(), numbering the names and tags as a snapshot does.
+    """
+    names = sorted(set(name for name, _ in name_tags))
+    tags = sorted(set(tag for _, tag in name_tags))
+    matches = image_filter.matcher(names, tags)
+    return matches([(names.index(name), tags.index(tag)) for name, tag in name_tags])
+
+
+def test_no_patterns():
+    image_filter = ImageFilter([], [])
+    assert _matches(image_filter, [("foo", "latest")])
+    assert not _matches(image_filter, [])
+
+
+def test_positive_patterns_must_all_match():
+    image_filter = ImageFilter(["someorg/.*", ".*/foo"], [])
+    assert _matches(image_filter, [("someorg/foo", "v1")])
+    assert not _matches(image_filter, [("someorg/bar", "v1")])
+    assert not _matches(image_filter, [("otherorg/foo", "v1")])
+    # partial matches don't count
+    assert not _matches(image_filter, [("someorg/foo_monitor", "v1")])
+
+
+def test_negative_patterns():
+    image_filter = ImageFilter(["~someorg/.*"], ["~latest", "~stable"])
+    assert _matches(image_filter, [("otherorg/foo", "v1")])
+    assert not _matches(image_filter, [("someorg/foo", "v1")])
+    assert not _matches(image_filter, [("otherorg/foo", "v1"), ("otherorg/foo", "stable")])
+    assert _matches(image_filter, [("otherorg/foo", "latest_but_not_quite")])
+
+
+def test_alternation_must_fully_match():
+    image_filter = ImageFilter(["foo|bar"], [])
+    assert _matches(image_filter, [("bar", "v1")])
+    assert not _matches(image_filter, [("foobar", "v1")])
+
+
+def test_patterns_with_groups():
+    image_filter = ImageFilter(["(?P<org>[a-z]+)/(?P=org)", "~(a)\\1/.*", "~(?P<org>b)/.*"], [])
+    assert _matches(image_filter, [("foo/foo", "v1")])
+    assert not _matches(image_filter, [("foo/bar", "v1")])
+    assert not _matches(image_filter, [("aa/aa", "v1")])
+    assert not _matches(image_filter, [("b/b", "v1")])
+
+
+def test_patterns_with_inline_flags():
+    image_filter = ImageFilter(["(?i)foo", "f.*"], ["~(?i)LATEST", "~v.*"])
+    assert _matches(image_filter, [("foo", "1.0")])
+    assert not _matches(image_filter, [("FOO", "1.0")])
+    assert not _matches(image_filter, [("foo", "latest")])
+    assert _matches(image_filter, [("foo", "V1")])
+
+
+def test_matcher():
+    image_filter = ImageFilter(["org/.*", "~org/bar"], ["~latest"])
+    matches = image_filter.matcher(["org/foo", "org/bar", "other"], ["v1", "latest"])
+    assert matches([(0, 0)])
+    assert not matches([(0, 1)])
+    assert not matches([(1, 0)])
+    assert not matches([(2, 0)])
+    assert matches([(2, 0), (0, 0)])
+    assert not matches([(0, 0), (1, 0)])
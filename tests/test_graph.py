@@ -0,0 +1,117 @@
+from docker import Client
+from mock import create_autospec
+
+from dockerrotate.graph import ImageGraph
+from dockerrotate.main import parse_arguments
+from utils import mins_ago, running_container_entry, containers_result
+
+
+BASE = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb00"
+IID1 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
+IID2 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb02"
+IID3 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb03"
+LAYER1 = "sha256:aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa01"
+LAYER2 = "sha256:aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa02"
+
+CID1 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc01"
+
+
+def _image(image_id, parent_id, virtual_size, minutes_ago, *repotags):
+    return dict(Id=image_id,
+                ParentId=parent_id,
+                Created=int(mins_ago(minutes_ago).strftime("%s")),
+                VirtualSize=virtual_size,
+                RepoTags=list(repotags or ["<none>:<none>"]))
+
+
+def _images():
+    """
+    BASE <- LAYER1 <- IID1 <- LAYER2 <- IID2
+                           <- IID3
+    """
+    return [
+        _image(BASE, "", 100, 300, "base:latest"),
+        _image(LAYER1, BASE, 110, 200),
+        _image(IID1, LAYER1, 120, 200, "foo:v1"),
+        _image(LAYER2, IID1, 140, 100),
+        _image(IID2, LAYER2, 150, 100, "foo:v2"),
+        _image(IID3, IID1, 125, 50, "bar:v1"),
+    ]
+
+
+def _sizes(graph):
+    return dict((image_id, image["VirtualSize"] - graph.images.get(image["ParentId"], {})
+                 .get("VirtualSize", 0)) for image_id, image in graph.images.items())
+
+
+def test_top_level_images():
+    graph = ImageGraph(_images())
+    assert [image["Id"] for image in graph.top_level_images()] == [BASE, IID1, IID2, IID3]
+
+
+def test_parent_with_kept_child_is_only_untagged():
+    graph = ImageGraph(_images())
+    images = graph.images
+    plan = graph.plan([images[IID1], images[IID2]], set(), _sizes(graph))
+
+    assert [[image["Id"] for image in wave] for wave in plan.waves] == [[IID2], [IID1]]
+    assert plan.untag_only == set([IID1])
+    # IID2 takes the intermediate layer between it and IID1 with it
+    assert plan.reclaimable == {IID2: 30, IID1: 0}
+
+
+def test_parent_goes_with_all_of_its_children():
+    graph = ImageGraph(_images())
+    images = graph.images
+    plan = graph.plan([images[IID1], images[IID2], images[IID3]], set(), _sizes(graph))
+
+    assert [[image["Id"] for image in wave] for wave in plan.waves] == \
+        [[IID2], [IID3], [IID1]]
+    assert plan.untag_only == set()
+    assert plan.reclaimable == {IID1: 20, IID2: 30, IID3: 5}
+
+
+def test_image_in_use_is_kept():
+    graph = ImageGraph(_images())
+    images = graph.images
+    plan = graph.plan([images[IID1], images[IID2], images[IID3]], set([IID3]), _sizes(graph))
+
+    assert plan.untag_only == set([IID1, IID3])
+
+
+def test_removed_images_leave_the_graph():
+    graph = ImageGraph(_images())
+    graph.remove([IID3])
+    images = graph.images
+    plan = graph.plan([images[IID1], images[IID2]], set(), _sizes(graph))
+
+    assert plan.untag_only == set()
+
+
+def test_clean_images_only_untags_parents():
+    args = parse_arguments(['images', '--keep', '1', '--name', 'foo'])
+    args.client = create_autospec(Client)
+    args.client.images.return_value = _images()
+    args.client.containers.return_value = containers_result(
+        [running_container_entry(CID1, IID3, mins_ago(10))])
+
+    args.func(args)
+
+    args.client.images.assert_called_once_with(all=True)
+    removed = [call[0][0] for call in args.client.remove_image.call_args_list]
+    assert removed == ["foo:v1"]
+
+
+def test_clean_images_leaves_untagged_images():
+    args = parse_arguments(['images', '--keep', '1'])
+    args.client = create_autospec(Client)
+    args.client.images.return_value = [
+        _image(IID1, "", 100, 300),
+        _image(IID2, "", 100, 200),
+        _image(IID3, "", 100, 100, "foo:1"),
+    ]
+    args.client.containers.return_value = containers_result([])
+
+    args.func(args)
+
+    assert not args.client.remove_image.called
@@ -1,9 +1,18 @@
+from collections import defaultdict
+import random
+
+from docker import Client
+from docker.errors import APIError
+from mock import create_autospec
 import pytest
 
-from dockerrotate.images import determine_images_to_remove, find_image_ids_to_keep
+from dockerrotate.graph import RemovalPlan
+from dockerrotate.images import determine_images_to_remove, find_images_to_keep, \
+    find_unique_sizes, limit_to_target, remove_images
 from dockerrotate.main import parse_arguments
+from dockerrotate.snapshot import ImageSnapshot
 
-from utils import image_entry, created_container_entry, containers_result, mins_ago
+from utils import image_entry, created_container_entry, containers_result, mins_ago, api_error
 
 
 IID1 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
@@ -50,8 +59,7 @@ def test_keep_zero():
     ]
     args = parse_arguments(['images', '--keep', '0'])
 
-    ids_to_keep = find_image_ids_to_keep(images, args)
-    assert ids_to_keep == set()
+    assert find_images_to_keep(ImageSnapshot(images), args) == set()
 
     result = determine_images_to_remove(images, [], args)
     _assert_ids(result, IID1, IID2, IID3, IID4)
@@ -180,3 +188,154 @@ def test_regexes():
     result = determine_images_to_remove(images, [], args)
     _assert_ids(result, IID1, IID2)
 
+
+def test_keep_matches_sorted_selection():
+    # heap-based retention must pick exactly what sorting by Created and taking the last N does,
+    # including for ties and images with several tags for the same name.
+    rng = random.Random(1234)
+    images = [
+        image_entry("sha256:{:064x}".format(index), mins_ago(rng.randint(0, 20)),
+                    *["{}:v{}".format(rng.choice("abcd"), tag)
+                      for tag in range(rng.randint(1, 3))])
+        for index in range(200)
+    ]
+
+    for keep in (1, 2, 5):
+        images_by_name = defaultdict(list)
+        for image in images:
+            for image_name in set(name_tag.split(":")[0] for name_tag in image["RepoTags"]):
+                images_by_name[image_name].append(image)
+        expected = set(image["Id"]
+                       for images_with_name in images_by_name.values()
+                       for image in sorted(images_with_name,
+                                           key=lambda image: image["Created"])[-keep:])
+
+        args = parse_arguments(['images', '--keep', str(keep)])
+        snapshot = ImageSnapshot(images)
+        assert snapshot.ids(find_images_to_keep(snapshot, args)) == expected
+
+
+def _labeled(image, **labels):
+    image["Labels"] = labels
+    return image
+
+
+def test_label_filters():
+    images = [
+        _labeled(image_entry(IID1, mins_ago(200), "foo:v1"), app="web"),
+        _labeled(image_entry(IID2, mins_ago(190), "foo:v2"), app="web", **{"rotate.keep": "true"}),
+        _labeled(image_entry(IID3, mins_ago(180), "foo:v3"), app="worker"),
+        image_entry(IID4, mins_ago(170), "foo:v4"),
+        _labeled(image_entry(IID5, mins_ago(160), "foo:v5"), app="web"),
+    ]
+
+    args = parse_arguments(['images', '--keep', '1', '--label', '~rotate.keep=true'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID3, IID4)
+
+    args = parse_arguments(['images', '--keep', '1', '--label', 'app'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2, IID3)
+
+    args = parse_arguments(['images', '--keep', '1', '--label', 'app=w.*',
+                            '--label', '~app=worker', '--label', '~rotate.keep=tru'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2)
+
+
+def test_keep_by_label():
+    images = [
+        _labeled(image_entry(IID1, mins_ago(200), "foo:v1"), app="web"),
+        _labeled(image_entry(IID2, mins_ago(190), "bar:v1"), app="web"),
+        _labeled(image_entry(IID3, mins_ago(180), "foo:v2"), app="worker"),
+        image_entry(IID4, mins_ago(170), "foo:v3"),
+        image_entry(IID5, mins_ago(160), "foo:v4"),
+        _labeled(image_entry(IID6, mins_ago(150), "bar:v2"), app="web"),
+    ]
+
+    # groups: app=web (IID1, IID2, IID6), app=worker (IID3), foo (IID4, IID5)
+    args = parse_arguments(['images', '--keep', '1', '--keep-by-label', 'app'])
+    snapshot = ImageSnapshot(images)
+    assert snapshot.ids(find_images_to_keep(snapshot, args)) == set([IID3, IID5, IID6])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2, IID4)
+
+
+def test_keep_with_ages():
+    images = [
+        image_entry(IID1, mins_ago(60 * 24 * 10), "foo:v1"),
+        image_entry(IID2, mins_ago(60 * 24 * 9), "foo:v2"),
+        image_entry(IID3, mins_ago(60 * 5), "foo:v3"),
+        image_entry(IID4, mins_ago(60 * 4), "foo:v4"),
+        image_entry(IID5, mins_ago(30), "foo:v5"),
+        image_entry(IID6, mins_ago(20), "foo:v6"),
+        image_entry(IID7, mins_ago(60 * 24 * 30), "bar:v1"),
+    ]
+
+    # images younger than "--min-age" are kept beyond "--keep"
+    args = parse_arguments(['images', '--keep', '1', '--min-age', '1h'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2, IID3, IID4)
+
+    # ... even with "--keep 0"
+    args = parse_arguments(['images', '--keep', '0', '--min-age', '1h'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2, IID3, IID4, IID7)
+
+    # images older than "--max-age" don't count towards "--keep"
+    args = parse_arguments(['images', '--keep', '3', '--max-age', '1d'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2, IID3, IID7)
+
+    args = parse_arguments(['images', '--keep', '3', '--max-age', '1d', '--min-age', '6h'])
+    _assert_ids(determine_images_to_remove(images, [], args), IID1, IID2, IID7)
+
+
+def _sized(image, size, parent_id=""):
+    image.update(Size=size, VirtualSize=size, ParentId=parent_id)
+    return image
+
+
+def test_unique_sizes():
+    images = [
+        _sized(image_entry(IID1, mins_ago(200), "base:v1"), 100),
+        _sized(image_entry(IID2, mins_ago(190), "foo:v1"), 130, IID1),
+        _sized(image_entry(IID3, mins_ago(180), "foo:v2"), 150, IID1),
+        # parent isn't listed; charge the full size
+        _sized(image_entry(IID4, mins_ago(170), "bar:v1"), 70, IID7),
+    ]
+    assert find_unique_sizes(images) == {IID1: 100, IID2: 30, IID3: 50, IID4: 70}
+
+
+def test_limit_to_target():
+    images = [
+        image_entry(IID1, mins_ago(180), "foo:v1"),
+        image_entry(IID2, mins_ago(200), "foo:v2"),
+        image_entry(IID3, mins_ago(190), "foo:v3"),
+    ]
+    sizes = {IID1: 10, IID2: 20, IID3: 30}
+
+    assert limit_to_target(images, sizes, None) == images
+    _assert_ids(limit_to_target(images, sizes, 20), IID2)
+    _assert_ids(limit_to_target(images, sizes, 21), IID2, IID3)
+    _assert_ids(limit_to_target(images, sizes, 1000), IID1, IID2, IID3)
+
+
+def test_remove_images_call_sequence():
+    conflict = api_error(APIError, 409, "image has dependent child images")
+
+    def remove_image(image, force=False, noprune=False):
+        if image == IID3:
+            raise conflict
+
+    images = [
+        # deleted by Id in one call
+        image_entry(IID1, mins_ago(200), "foo:v1", "bar:v1", "foo:v1"),
+        # a parent of a kept image: untagged only
+        image_entry(IID2, mins_ago(190), "foo:v2", "bar:v2"),
+        # unexpectedly a parent: deleting by Id fails, so it's untagged instead
+        image_entry(IID3, mins_ago(180), "foo:v3"),
+    ]
+    args = parse_arguments(['--concurrency', '1', 'images', '--keep', '0'])
+    args.client = create_autospec(Client)
+    args.client.remove_image.side_effect = remove_image
+
+    remove_images(RemovalPlan([images], set([IID2]), {}), args)
+
+    removed = [call[0][0] for call in args.client.remove_image.call_args_list]
+    assert removed == [IID1, "foo:v2", "bar:v2", IID3, "foo:v3"]
+    # versus untagging every tag and then deleting by Id: 4 + 3 + 2 calls
+    assert args.stats.counters["image_removal_calls_saved"] == 3 + 1 + 0
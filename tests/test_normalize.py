@@ -1,4 +1,4 @@
-from dockerrotate.images import normalize_tag_name
+from dockerrotate.snapshot import normalize_tag_name
 
 def test_normalize_tag_name():
 
@@ -0,0 +1,55 @@
+from StringIO import StringIO
+import json
+
+from docker.errors import APIError
+
+from dockerrotate.output import JsonReporter, TextReporter
+
+from utils import api_error
+
+
+CONTAINER = dict(Id="c1", Names=["/foo"], Image="foo:latest")
+IMAGE = dict(Id="i1", RepoTags=["foo:v1", "foo:v2"])
+
+
+def test_text():
+    stream = StringIO()
+    reporter = TextReporter(stream)
+    reporter.container(CONTAINER, "exited", None, 0.1)
+    reporter.image(IMAGE, "rotated", api_error(APIError, 409, "conflict"), 0.1)
+    reporter.close()
+
+    assert stream.getvalue().splitlines() == [
+        "Removing container ID: c1, Name: /foo, Image: foo:latest",
+        "Removing image ID: i1, Tags: foo:v1, foo:v2",
+        "unexpected: API error while trying to delete image. Error message is:",
+        "conflict",
+    ]
+
+
+def test_json():
+    stream = StringIO()
+    reporter = JsonReporter(stream, dry_run=False)
+    reporter.container(CONTAINER, "exited", None, 0.5)
+    reporter.untagged_image(dict(Id="i2"), "dangling", api_error(APIError, 409, "conflict"), 0.25)
+
+    # records are buffered until flushed
+    assert stream.getvalue() == ""
+    reporter.close()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert records == [
+        dict(kind="container", id="c1", names=["/foo"], image="foo:latest", reason="exited",
+             action="removed", duration=0.5, error=None),
+        dict(kind="untagged-image", id="i2", tags=[], reason="dangling",
+             action="failed", duration=0.25, error='409 Client Error:  ("conflict")'),
+    ]
+
+
+def test_json_dry_run():
+    stream = StringIO()
+    reporter = JsonReporter(stream, dry_run=True)
+    reporter.image(IMAGE, "rotated", None, 0.0)
+    reporter.close()
+
+    assert json.loads(stream.getvalue())["action"] == "dry-run"
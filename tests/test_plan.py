@@ -0,0 +1,150 @@
+from StringIO import StringIO
+import json
+
+from docker import Client
+from mock import create_autospec
+import pytest
+
+from dockerrotate.main import parse_arguments
+from utils import image_entry, exited_container_entry, running_container_entry, mins_ago, \
+                  containers_result
+
+
+IID1 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
+IID2 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb02"
+IID3 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb03"
+IID4 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb04"
+
+CID1 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc01"
+CID2 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc02"
+
+
+def _images():
+    return [
+        image_entry(IID1, mins_ago(200), "foo:v1.1"),
+        image_entry(IID2, mins_ago(190), "foo:v1.2"),
+        image_entry(IID3, mins_ago(180), "foo:v1.3"),
+        image_entry(IID4, mins_ago(300), "<none>:<none>"),
+    ]
+
+
+def _containers():
+    return [
+        exited_container_entry(CID1, IID1, mins_ago(120)),
+        running_container_entry(CID2, IID3, mins_ago(120)),
+    ]
+
+
+def _mock_client(images, containers):
+    mock_client = create_autospec(Client)
+    mock_client.images.return_value = images
+    mock_client.containers.return_value = containers_result(containers)
+    lookup = {container["Id"]: container for container in containers}
+    mock_client.inspect_container.side_effect = lambda container_id: lookup[container_id]
+    return mock_client
+
+
+def _removed(client):
+    return ([call[0][0] for call in client.remove_container.call_args_list],
+            [call[0][0] for call in client.remove_image.call_args_list])
+
+
+def _plan(path):
+    args = parse_arguments(['plan', path, 'all', '--exited', '1h', '--keep', '1'])
+    args.client = _mock_client(_images(), _containers())
+    args.func(args)
+    assert _removed(args.client) == ([], [])
+    return args
+
+
+def test_plan_then_apply(tmpdir):
+    path = str(tmpdir.join("plan.json"))
+    _plan(path)
+
+    with open(path) as plan_file:
+        plan = json.load(plan_file)
+    assert [container["Id"] for container in plan["containers"]] == [CID1]
+    assert [image["Id"] for image in plan["untagged_images"]] == [IID4]
+    assert [[image["Id"] for image in wave] for wave in plan["images"]["waves"]] == \
+        [[IID1, IID2]]
+
+    args = parse_arguments(['apply', path])
+    args.client = _mock_client(_images(), _containers())
+    args.func(args)
+
+    # no inspection needed to apply the plan
+    assert not args.client.inspect_container.called
+    assert _removed(args.client) == ([CID1], [IID4, IID1, IID2])
+
+
+def test_stale_entries_are_skipped(tmpdir):
+    path = str(tmpdir.join("plan.json"))
+    _plan(path)
+
+    # since the plan was made, CID1 has gone, IID2 has been tagged again, and IID1 has been
+    # removed
+    images = _images()
+    images[1]["RepoTags"] = ["foo:v1.2", "foo:latest"]
+    del images[0]
+    args = parse_arguments(['--stats', 'apply', path])
+    args.client = _mock_client(images, _containers()[1:])
+    args.func(args)
+
+    assert _removed(args.client) == ([], [IID4])
+    assert args.stats.counters["stale_plan_entries"] == 3
+
+
+def test_untagged_image_tagged_since_is_skipped(tmpdir):
+    path = str(tmpdir.join("plan.json"))
+    args = parse_arguments(['plan', path, 'untagged-images'])
+    # as listed with the "dangling=true" filter
+    args.client = _mock_client(_images()[3:], _containers())
+    args.func(args)
+
+    images = _images()
+    images[3]["RepoTags"] = ["prod:latest"]
+    args = parse_arguments(['--stats', 'apply', path])
+    args.client = _mock_client(images, _containers())
+    args.func(args)
+
+    assert _removed(args.client) == ([], [])
+    assert args.stats.counters["stale_plan_entries"] == 1
+
+
+def test_planned_removals_are_reported_as_dry_run(tmpdir):
+    path = str(tmpdir.join("plan.json"))
+    args = parse_arguments(['--output', 'json', 'plan', path, 'untagged-images'])
+    args.reporter.stream = StringIO()
+    args.client = _mock_client(_images()[3:], _containers())
+    args.func(args)
+    args.reporter.close()
+
+    records = [json.loads(line) for line in args.reporter.stream.getvalue().splitlines()]
+    assert [(record["id"], record["action"]) for record in records] == [(IID4, "dry-run")]
+
+
+def test_old_plan_is_refused(tmpdir):
+    path = str(tmpdir.join("plan.json"))
+    _plan(path)
+
+    args = parse_arguments(['apply', path, '--max-plan-age', '0s'])
+    args.client = _mock_client(_images(), _containers())
+    with pytest.raises(SystemExit):
+        args.func(args)
+    assert _removed(args.client) == ([], [])
+
+
+def test_plan_for_another_daemon_is_refused(tmpdir):
+    path = str(tmpdir.join("plan.json"))
+    args = parse_arguments(['plan', path, 'containers', '--exited', '1h'])
+    args.client = _mock_client(_images(), _containers())
+    args.daemon = "unix:///run/one.sock"
+    args.func(args)
+
+    args = parse_arguments(['apply', path])
+    args.client = _mock_client(_images(), _containers())
+    args.daemon = "unix:///run/two.sock"
+    with pytest.raises(SystemExit) as error:
+        args.func(args)
+    assert "unix:///run/one.sock" in str(error.value)
+    assert _removed(args.client) == ([], [])
@@ -0,0 +1,48 @@
+import time
+
+from docker.errors import APIError
+
+from dockerrotate.main import parse_arguments
+from dockerrotate.removal import remove_all
+
+from utils import api_error
+
+
+def test_results_are_ordered():
+    removed = []
+
+    def remove(delay):
+        # later items finish first; results must still come back in input order
+        time.sleep(delay)
+        removed.append(delay)
+
+    args = parse_arguments(['--concurrency', '4', 'untagged-images'])
+    delays = [0.04, 0.03, 0.02, 0.01]
+    result = list(remove_all(delays, remove, args))
+
+    assert [(delay, error) for delay, error, _ in result] == [(delay, None) for delay in delays]
+    assert all(duration >= delay for delay, _, duration in result)
+    assert sorted(removed) == sorted(delays)
+
+
+def test_errors_are_captured():
+    error = api_error(APIError, 409, "conflict")
+
+    def remove(obj):
+        if obj == "b":
+            raise error
+
+    args = parse_arguments(['untagged-images'])
+    result = [(obj, err) for obj, err, _ in remove_all(["a", "b", "c"], remove, args)]
+
+    assert result == [("a", None), ("b", error), ("c", None)]
+
+
+def test_dry_run():
+    def remove(obj):
+        raise AssertionError("nothing should be removed in dry-run mode")
+
+    args = parse_arguments(['--dry-run', 'untagged-images'])
+    result = list(remove_all(["a", "b"], remove, args))
+
+    assert result == [("a", None, 0.0), ("b", None, 0.0)]
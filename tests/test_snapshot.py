@@ -0,0 +1,35 @@
+from dockerrotate.snapshot import ImageSnapshot
+
+from utils import image_entry, mins_ago
+
+
+def test_snapshot():
+    images = [
+        image_entry("i1", mins_ago(20), "registry.example.com/org/foo:v1", "org/foo:latest"),
+        image_entry("i2", mins_ago(10), "org/foo:v1", "org/foo:v1", "bar:latest"),
+    ]
+    snapshot = ImageSnapshot(images)
+
+    assert len(snapshot) == 2
+    assert snapshot.names == ["org/foo", "bar"]
+    assert snapshot.tags == ["v1", "latest"]
+    # duplicate tags are dropped
+    assert snapshot.name_tags == [((0, 0), (0, 1)), ((0, 0), (1, 1))]
+    assert list(snapshot.created) == [image["Created"] for image in images]
+
+    assert snapshot.positions(["i2", "missing"]) == set([1])
+    assert snapshot.ids([0, 1]) == set(["i1", "i2"])
+
+
+def test_label_index():
+    images = [image_entry("i1", mins_ago(20), "foo:v1"),
+              image_entry("i2", mins_ago(10), "foo:v2"),
+              image_entry("i3", mins_ago(10), "foo:v3")]
+    images[0]["Labels"] = dict(app="web", team="a")
+    images[1]["Labels"] = None
+    images[2]["Labels"] = dict(app="web")
+    snapshot = ImageSnapshot(images)
+
+    assert snapshot.labels == dict(app=dict(web=[0, 2]), team=dict(a=[0]))
+    assert snapshot.label_values("app") == {0: "web", 2: "web"}
+    assert snapshot.label_values("missing") == {}
@@ -0,0 +1,115 @@
+from BaseHTTPServer import BaseHTTPRequestHandler
+import json
+import os
+import SocketServer
+import threading
+
+from docker.errors import APIError, NotFound
+import pytest
+
+from dockerrotate.socketclient import SocketClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def address_string(self):
+        return "unix"
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        if self.path.startswith("/v1.24/containers/missing/"):
+            self._respond(404, '{"message": "No such container: missing"}')
+        elif self.path == "/version":
+            self._respond(200, json.dumps(dict(ApiVersion="1.24")))
+        else:
+            self._respond(200, json.dumps([dict(Id="abc")]))
+        if self.server.close_after_response:
+            self.close_connection = 1
+
+    def do_DELETE(self):
+        self.server.requests.append(("DELETE", self.path))
+        if "conflict" in self.path:
+            self._respond(409, '{"message": "conflict"}')
+        else:
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server(tmpdir):
+    path = str(tmpdir.join("docker.sock"))
+    server = _Server(path, _Handler)
+    server.connections = 0
+    server.requests = []
+    server.close_after_response = False
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    os.remove(path)
+
+
+def _client(server):
+    return SocketClient("unix://" + server.server_address, version="1.24", timeout=5)
+
+
+def test_connections_are_reused(server):
+    client = _client(server)
+    for _ in range(3):
+        assert client.containers(all=True, filters=dict(status=["exited"])) == [dict(Id="abc")]
+    client.remove_image("foo/bar:latest", force=True)
+
+    assert server.connections == 1
+    assert server.requests[0] == (
+        "GET", "/v1.24/containers/json?all=1&filters=%7B%22status%22%3A+%5B%22exited%22%5D%7D")
+    assert server.requests[-1] == ("DELETE", "/v1.24/images/foo/bar:latest?force=1&noprune=0")
+
+
+def test_unversioned_version(server):
+    client = SocketClient("unix://" + server.server_address)
+    assert client.version() == dict(ApiVersion="1.24")
+    assert server.requests == [("GET", "/version")]
+
+
+def test_errors(server):
+    client = _client(server)
+    with pytest.raises(NotFound):
+        client.inspect_container("missing")
+    with pytest.raises(APIError) as error:
+        client.remove_container("conflict")
+    assert error.value.response.status_code == 409
+
+    # the connection is still usable after an error
+    client.images()
+    assert server.connections == 1
+
+
+def test_closed_connections_are_replaced(server):
+    server.close_after_response = True
+    client = _client(server)
+    client.images()
+    client.images()
+
+    assert server.connections == 2
@@ -0,0 +1,42 @@
+from docker import Client
+from mock import create_autospec
+
+from dockerrotate.stats import InstrumentedClient, Stats
+
+
+def test_instrumented_client():
+    stats = Stats()
+    mock_client = create_autospec(Client)
+    mock_client.images.return_value = []
+    mock_client.api_version = "1.24"
+    client = InstrumentedClient(mock_client, stats)
+
+    assert client.images(all=True) == []
+    client.images()
+    client.remove_image("foo:latest")
+
+    assert client.api_version == "1.24"
+    assert dict(stats.calls) == dict(images=2, remove_image=1)
+    mock_client.images.assert_called_with()
+
+
+def test_phases_and_prometheus_textfile(tmpdir):
+    stats = Stats()
+    with stats.phase("list_images"):
+        with stats.call("images"):
+            pass
+    with stats.phase("remove_images"):
+        pass
+    stats.count("saved_calls", 3)
+
+    assert stats.phases == ["list_images", "remove_images"]
+
+    path = tmpdir.join("docker_rotate.prom")
+    stats.write_prometheus_textfile(str(path))
+    lines = path.read().splitlines()
+
+    assert 'docker_rotate_api_calls{endpoint="images"} 1' in lines
+    assert 'docker_rotate_counter{name="saved_calls"} 3' in lines
+    assert any(line.startswith('docker_rotate_phase_seconds{phase="remove_images"} ')
+               for line in lines)
+    assert tmpdir.listdir() == [path]
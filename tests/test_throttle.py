@@ -0,0 +1,67 @@
+import threading
+import time
+
+from dockerrotate.main import parse_arguments
+from dockerrotate.removal import remove_all
+from dockerrotate.stats import Stats
+from dockerrotate.throttle import Throttle
+
+
+def test_rate_limit():
+    args = parse_arguments(['--max-removals-per-second', '50', 'untagged-images'])
+
+    started = time.time()
+    list(remove_all(range(6), lambda obj: None, args))
+
+    # the first removal starts straight away, then one every 20ms
+    assert time.time() - started >= 0.1
+
+
+def test_max_in_flight():
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def remove(obj):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+    args = parse_arguments(['--concurrency', '8', '--max-in-flight', '2', 'untagged-images'])
+    list(remove_all(range(10), remove, args))
+
+    assert peak[0] == 2
+
+
+def test_slow_removals_back_off():
+    stats = Stats()
+    throttle = Throttle(rate=100, max_in_flight=8, latency_threshold=0.01, stats=stats)
+
+    with throttle.slot():
+        time.sleep(0.02)
+
+    assert throttle.in_flight_limit == 4
+    assert throttle.rate == 50
+    assert stats.counters["removal_slowdowns"] == 1
+
+    # the next removal waits for as long as the slow one took
+    started = time.time()
+    with throttle.slot():
+        pass
+    assert time.time() - started >= 0.015
+
+    # and fast removals recover gradually
+    assert throttle.in_flight_limit == 5
+    assert throttle.rate == 60
+
+
+def test_no_backoff_without_threshold():
+    throttle = Throttle(max_in_flight=4)
+
+    with throttle.slot():
+        time.sleep(0.01)
+
+    assert throttle.in_flight_limit == 4
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from dateutil import parser
+from dateutil.tz import tzutc
+
+from dockerrotate.timestamps import parse_timestamp
+
+
+def test_nanoseconds_are_truncated():
+    assert parse_timestamp("2016-08-03T17:29:53.474346591Z") == \
+        datetime(2016, 8, 3, 17, 29, 53, 474346, tzutc())
+
+
+def test_short_fraction():
+    assert parse_timestamp("2016-08-03T17:29:53.5Z") == \
+        datetime(2016, 8, 3, 17, 29, 53, 500000, tzutc())
+
+
+def test_whole_seconds():
+    assert parse_timestamp("2016-08-03T17:29:53Z") == datetime(2016, 8, 3, 17, 29, 53, 0, tzutc())
+
+
+def test_zero_value():
+    assert parse_timestamp("0001-01-01T00:00:00Z") == datetime(1, 1, 1, tzinfo=tzutc())
+
+
+def test_other_formats_fall_back_to_dateutil():
+    for value in ("2016-08-03T19:29:53.474346+02:00", "2016-08-03 17:29:53"):
+        assert parse_timestamp(value) == parser.parse(value)
@@ -0,0 +1,82 @@
+import json
+
+from docker import Client
+from mock import create_autospec
+
+from dockerrotate.main import parse_arguments
+from utils import image_entry, created_container_entry, containers_result, mins_ago
+
+
+IID1 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
+IID2 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb02"
+IID3 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb03"
+
+CID1 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc01"
+
+
+def _mock_client(images, containers):
+    mock_client = create_autospec(Client)
+    mock_client.images.return_value = images
+    mock_client.containers.return_value = containers_result(containers)
+    mock_client._result.return_value = dict(
+        ImagesDeleted=[dict(Untagged=IID1), dict(Deleted=IID1), dict(Deleted=IID2)],
+        SpaceReclaimed=1234,
+    )
+    return mock_client
+
+
+def _removed(mock_client):
+    return [call[0][0] for call in mock_client.remove_image.call_args_list]
+
+
+IMAGES = [
+    image_entry(IID1, mins_ago(200), "<none>:<none>"),
+    image_entry(IID2, mins_ago(100), "<none>:<none>"),
+    image_entry(IID3, mins_ago(10), "<none>:<none>"),
+]
+
+
+def test_in_use_and_min_age():
+    containers = [created_container_entry(CID1, IID1, mins_ago(5))]
+    args = parse_arguments(['untagged-images', '--min-age', '1h'])
+    args.client = _mock_client(IMAGES, containers)
+
+    args.func(args)
+
+    assert _removed(args.client) == [IID2]
+
+
+def test_prune():
+    args = parse_arguments(['untagged-images', '--prune', '--min-age', '1h'])
+    args.client = _mock_client(IMAGES, [])
+    args.api_version = "1.28"
+
+    args.func(args)
+
+    assert not args.client.remove_image.called
+    args.client._url.assert_called_once_with("/images/prune")
+    params = args.client._post.call_args[1]["params"]
+    assert json.loads(params["filters"]) == dict(dangling=["true"], until=["3600s"])
+
+
+def test_prune_falls_back_on_old_engines(capsys):
+    args = parse_arguments(['untagged-images', '--prune', '--min-age', '1h'])
+    args.client = _mock_client(IMAGES, [])
+    args.api_version = "1.25"
+
+    args.func(args)
+
+    assert not args.client._post.called
+    assert _removed(args.client) == [IID1, IID2]
+    assert "needs API 1.28+, but requests are made at API 1.25" in capsys.readouterr()[1]
+
+
+def test_prune_falls_back_in_dry_run():
+    args = parse_arguments(['--dry-run', 'untagged-images', '--prune'])
+    args.client = _mock_client(IMAGES, [])
+    args.api_version = "1.28"
+
+    args.func(args)
+
+    assert not args.client._post.called
+    assert not args.client.remove_image.called
@@ -0,0 +1,179 @@
+from datetime import timedelta
+import time
+
+from docker import Client
+from docker.errors import NotFound
+from mock import Mock, create_autospec
+
+from dockerrotate.main import parse_arguments
+from dockerrotate.watch import Watcher
+from utils import image_entry, exited_container_entry, running_container_entry, mins_ago, \
+                  containers_result, api_error
+
+
+IID1 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb01"
+IID2 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb02"
+IID3 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb03"
+IID4 = "sha256:bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb04"
+
+CID1 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc01"
+CID2 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc02"
+CID3 = "sha256:cccccccccccccccccccccccccccccccccccccccccccccccccccccccccccccc03"
+
+
+def _mock_client(images, containers, image_inspections=None):
+    mock_client = create_autospec(Client)
+    mock_client.images.return_value = images
+    mock_client.containers.return_value = containers_result(containers)
+    mock_client.events.return_value = iter([])
+    lookup = {container["Id"]: container for container in containers}
+
+    def _inspect_container(container_id):
+        if container_id not in lookup:
+            raise api_error(NotFound, 404, "No such container")
+        return lookup[container_id]
+
+    def _inspect_image(image_id):
+        if image_id not in (image_inspections or {}):
+            raise api_error(NotFound, 404, "No such image")
+        return image_inspections[image_id]
+
+    mock_client.inspect_container.side_effect = _inspect_container
+    mock_client.inspect_image.side_effect = _inspect_image
+    return mock_client, lookup
+
+
+def _removed_containers(client):
+    return [call[0][0] for call in client.remove_container.call_args_list]
+
+
+def _removed_images(client):
+    return [call[0][0] for call in client.remove_image.call_args_list]
+
+
+def test_containers_are_removed_when_due():
+    containers = [
+        exited_container_entry(CID1, IID1, mins_ago(120)),
+        exited_container_entry(CID2, IID1, mins_ago(30)),
+        running_container_entry(CID3, IID1, mins_ago(120)),
+    ]
+    args = parse_arguments(['watch', '--exited', '1h'])
+    args.client, _ = _mock_client([], containers)
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+    watcher.remove_due_containers()
+
+    assert _removed_containers(args.client) == [CID1]
+    # the other exited container is due in half an hour
+    assert [container_id for due, container_id in watcher.due] == [CID2]
+    assert abs(watcher.due[0][0] - (mins_ago(30) + timedelta(hours=1))) < timedelta(seconds=1)
+
+
+def test_container_events_reschedule():
+    containers = [running_container_entry(CID1, IID1, mins_ago(120))]
+    args = parse_arguments(['watch', '--exited', '1h'])
+    args.client, lookup = _mock_client([], containers)
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+    assert watcher.due == []
+
+    # the container stops, long enough ago to be due immediately
+    lookup[CID1] = exited_container_entry(CID1, IID1, mins_ago(90))
+    watcher.handle(dict(Type="container", Action="die", id=CID1))
+    watcher.remove_due_containers()
+
+    assert _removed_containers(args.client) == [CID1]
+
+
+def test_due_container_restarted_is_not_removed():
+    containers = [exited_container_entry(CID1, IID1, mins_ago(90))]
+    args = parse_arguments(['watch', '--exited', '1h'])
+    args.client, lookup = _mock_client([], containers)
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+    lookup[CID1] = running_container_entry(CID1, IID1, mins_ago(1))
+    watcher.remove_due_containers()
+
+    assert _removed_containers(args.client) == []
+
+
+def test_rotation_only_for_touched_names():
+    images = [
+        image_entry(IID1, mins_ago(200), "foo:v1.1"),
+        image_entry(IID2, mins_ago(190), "foo:v1.2"),
+        image_entry(IID4, mins_ago(300), "bar:v1"),
+    ]
+    image_inspections = {
+        "foo:v1.3": dict(Id=IID3, Created=mins_ago(1).isoformat(), RepoTags=["foo:v1.3"]),
+    }
+    args = parse_arguments(['watch', '--keep', '1'])
+    args.client, _ = _mock_client(images, [], image_inspections)
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+    watcher.rotate_images()
+    assert _removed_images(args.client) == [IID1]
+
+    watcher.handle(dict(Type="image", Action="delete", id=IID1))
+    watcher.handle(dict(Type="image", Action="pull", id="foo:v1.3"))
+    assert watcher.touched_names == set(["foo"])
+    watcher.rotate_images()
+
+    assert _removed_images(args.client) == [IID1, IID2]
+
+
+def test_destroyed_container_frees_image():
+    images = [
+        image_entry(IID1, mins_ago(200), "foo:v1.1"),
+        image_entry(IID2, mins_ago(190), "foo:v1.2"),
+    ]
+    containers = [running_container_entry(CID1, IID1, mins_ago(120))]
+    args = parse_arguments(['watch', '--keep', '1'])
+    args.client, _ = _mock_client(images, containers)
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+    watcher.rotate_images()
+    assert _removed_images(args.client) == []
+
+    watcher.handle(dict(Type="container", Action="destroy", id=CID1))
+    watcher.rotate_images()
+
+    assert _removed_images(args.client) == [IID1]
+
+
+def test_without_keep_images_are_left_alone():
+    images = [
+        image_entry(IID1, mins_ago(200), "foo:v1.1"),
+        image_entry(IID2, mins_ago(190), "foo:v1.2"),
+    ]
+    args = parse_arguments(['watch', '--exited', '1h'])
+    args.client, _ = _mock_client(images, [])
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+    watcher.rotate_images()
+
+    assert _removed_images(args.client) == []
+
+
+def test_events_since_with_docker_py():
+    # go through docker-py's own events(), which converts `since` for the request
+    client = Client(base_url="unix:///var/run/docker.sock", version="1.24")
+    client.images = Mock(return_value=[])
+    client.containers = Mock(return_value=[])
+    client.get = Mock()
+    client._stream_helper = Mock(return_value=iter([]))
+    args = parse_arguments(['watch', '--exited', '1h'])
+    args.client = client
+    args.api_version = "1.24"
+
+    watcher = Watcher(args)
+    watcher.snapshot()
+
+    assert isinstance(watcher.events.get(timeout=5), EOFError)
+    since = client.get.call_args[1]["params"]["since"]
+    assert abs(since - time.time()) < 5
@@ -0,0 +1,20 @@
+import pytest
+
+from dockerrotate.workers import imap_ordered
+
+
+def test_ordered():
+    assert list(imap_ordered(lambda item: item * 2, range(100), 8)) == \
+        [item * 2 for item in range(100)]
+
+
+def test_exceptions_propagate():
+    def func(item):
+        if item == 3:
+            raise ValueError(item)
+        return item
+
+    results = imap_ordered(func, range(10), 4)
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(ValueError):
+        next(results)
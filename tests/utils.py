@@ -5,6 +5,9 @@ This file contains utility classes and generators for use in tests.
 import datetime
 
 from dateutil.tz import tzutc
+from mock import Mock
+
+from dockerrotate.timestamps import parse_timestamp
 
 NOW = datetime.datetime.now(tzutc())
 
@@ -32,6 +35,7 @@ def image_entry(image_id, created, *repotags):
 def exited_container_entry(container_id, image_id, timestamp):
     return dict(Id=container_id,
                 Image=image_id,
+                Created=_to_timestamp(timestamp),
                 State=dict(ExitCode=0,
                            FinishedAt=_to_timestamp(timestamp),
                            OOMKilled=False,
@@ -52,6 +56,7 @@ def created_container_entry(container_id, image_id, timestamp):
                    Paused=False,
                    Restarting=False,
                    Running=False,
+                   FinishedAt="0001-01-01T00:00:00Z",
                    StartedAt=_to_timestamp(timestamp),
                    Status="created"))
 
@@ -60,6 +65,7 @@ def dead_container_entry(container_id, image_id, timestamp):
     return dict(
         Id=container_id,
         Image=image_id,
+        Created=_to_timestamp(timestamp),
         State=dict(OOMKilled=False,
                    Dead=True,
                    Paused=False,
@@ -83,6 +89,31 @@ def running_container_entry(container_id, image_id, timestamp):
                    Status="running"))
 
 
+def _human_duration(seconds):
+    """
+    Format a duration the way the daemon does in the container list, roughly.
+    """
+    for unit, unit_seconds in (("day", 24 * 3600), ("hour", 3600), ("minute", 60)):
+        if seconds >= 2 * unit_seconds:
+            return "{} {}s".format(int(seconds // unit_seconds), unit)
+    return "{} seconds".format(int(seconds))
+
+
+def list_status(container):
+    """
+    Return the human readable "Status" the container list shows for a container.
+    """
+    state = container["State"]
+    if state["Status"] == "exited":
+        finished_at = parse_timestamp(state["FinishedAt"])
+        return "Exited ({}) {} ago".format(
+            state.get("ExitCode", 0), _human_duration((NOW - finished_at).total_seconds()))
+    if state["Status"] == "running":
+        return "Up {}".format(_human_duration(
+            (NOW - parse_timestamp(state["StartedAt"])).total_seconds()))
+    return state["Status"].capitalize()
+
+
 def containers_result(containers):
     """
     Generates something that looks like of the result from the "docker.Client.containers()" call.
@@ -90,6 +121,28 @@ def containers_result(containers):
     information requires a call to "docker.Client.inspect_container()"
     """
     return [dict(Id=container["Id"],
-                 ImageID=container["Image"]) for container in containers]
+                 Image=container["Image"],
+                 ImageID=container["Image"],
+                 Status=list_status(container)) for container in containers]
+
+
+def api_error(error_class, status_code, explanation):
+    """
+    Build a docker-py APIError (or subclass) the way the client raises it for an HTTP error.
+    """
+    response = Mock(status_code=status_code, reason="", content=explanation)
+    return error_class(explanation, response)
 
 
+def containers_list_result(containers, filters=None):
+    """
+    Like "containers_result", but for API 1.23+, where the list includes each container's state.
+    Supports the "status" filter.
+    """
+    statuses = (filters or {}).get("status")
+    return [dict(Id=container["Id"],
+                 Image=container["Image"],
+                 ImageID=container["Image"],
+                 State=container["State"]["Status"],
+                 Status=list_status(container)) for container in containers
+            if statuses is None or container["State"]["Status"] in statuses]